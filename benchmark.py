@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+import synthetic
+import cluster
+import tools
+from process import GroupedDataset
+
+STAGES = ['time_normalisation', 'routes_organise', 'stops_organise', 'find_nearest_trips', 'routes_plot']
+
+# The modules of the ingest and match path, which must load without the map, road network and optimisation libraries.
+CORE_MODULES = ['process', 'cluster', 'instances', 'metrics', 'dwell', 'spatial_index']
+HEAVY_MODULES = ['folium', 'branca', 'jinja2', 'osmnx', 'networkx', 'geopy', 'requests', 'scipy', 'matplotlib', 'pyproj']
+IMPORT_BUDGET = 1.0 # In seconds, numpy and pandas included.
+
+def import_time(modules:list=CORE_MODULES) -> dict:
+    """
+    Measure the time a fresh interpreter takes to import modules, as a short-lived worker process would.
+
+    Arguments:
+    modules: The modules imported.
+
+    Returns:
+    A dictionary with the import time in seconds and the heavy modules that got imported along.
+    """
+    code = ('import sys, time, json; start = time.perf_counter(); '
+            f'import {", ".join(modules)}; '
+            f'print(json.dumps({{"seconds": time.perf_counter() - start, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output)
+
+def run_once(stops_csv:str, routes_csv:str, workers:int=None, geojson:bool=True) -> dict:
+    """
+    Run the pipeline once on a dataset and time every stage separately.
+    Reading the CSV files is not timed, and the filters preparing find_nearest_trips are timed apart as 'filter'.
+
+    Arguments:
+    stops_csv, routes_csv: The location of the datasets.
+    workers: The number of processes organising the routes and stops.
+    geojson: Whether routes_plot draws GeoJSON layers instead of one marker per point.
+
+    Returns:
+    A dictionary {stage: seconds}.
+    """
+    import folium
+
+    timings = {}
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+        return result
+
+    dataset = GroupedDataset(stops_csv, routes_csv)
+    timed('time_normalisation', dataset.time_normalisation, dataset.dataset_routes, 'Tid')
+    timed('time_normalisation', dataset.time_normalisation, dataset.dataset_stops, 'DeliveredAt', time_shift=-synthetic.POD_TIME_SHIFT)
+    timed('routes_organise', dataset.routes_organise, ['Name', 'date'], workers=workers)
+    timed('stops_organise', dataset.stops_organise, ['Ruttnamn', 'date'], workers=workers)
+
+    names = dataset.stops.vehicles()
+    filtered_stops, stops_dates = timed('filter', cluster.stops_filter, dataset, names)
+    filtered_routes = timed('filter', cluster.routes_filter, dataset, stops_dates, names)
+    timed('find_nearest_trips', cluster.find_nearest_trips, filtered_stops, filtered_routes)
+
+    map = folium.Map(location=[59.3293, 18.0686], zoom_start=12)
+    timed('routes_plot', tools.routes_plot, map, dataset.routes, geojson=geojson)
+    return timings
+
+def benchmark(scales:list, data_dir:str, repeat:int=3, workers:int=None, geojson:bool=True, seed:int=0) -> dict:
+    """
+    Time the pipeline stages on synthetic datasets of growing size.
+    The datasets are generated once per scale and seed and reused by later runs.
+
+    Arguments:
+    scales: The numbers of pings, e.g. [10**3, 10**4, 10**5].
+    data_dir: The directory of the generated datasets.
+    repeat: The number of runs per scale. The best and median times of every stage are reported.
+    workers, geojson: See run_once.
+    seed: The seed of the generator.
+
+    Returns:
+    A dictionary {scale: {stage: {'best': seconds, 'median': seconds}}}.
+    """
+    results = {}
+    for scale in scales:
+        routes_csv = os.path.join(data_dir, f'GPS_{scale}_{seed}.csv')
+        stops_csv = os.path.join(data_dir, f'POD_{scale}_{seed}.csv')
+        if not (os.path.exists(routes_csv) and os.path.exists(stops_csv)):
+            synthetic.generate(routes_csv, stops_csv, pings=scale, seed=seed)
+        runs = [run_once(stops_csv, routes_csv, workers, geojson) for _ in range(repeat)]
+        results[scale] = {stage: {'best': min(run[stage] for run in runs), 'median': float(np.median([run[stage] for run in runs]))}
+                          for stage in runs[0]}
+    return results
+
+def report(results:dict) -> str:
+    """
+    Format the results of benchmark as a table of the best times in seconds, one row per stage and one column per scale.
+    """
+    scales = list(results)
+    stages = [stage for stage in STAGES + ['filter'] if stage in results[scales[0]]]
+    lines = ['stage'.ljust(20) + ''.join(f'{scale:>14,}' for scale in scales)]
+    for stage in stages:
+        lines.append(stage.ljust(20) + ''.join(f'{results[scale][stage]["best"]:>14.4f}' for scale in scales))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the pipeline stages on synthetic datasets.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10**3, 10**4, 10**5], help='The numbers of pings.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--markers', action='store_true', help='Plot one marker per point instead of GeoJSON layers.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default='Datasets/Synthetic')
+    parser.add_argument('--output', default=None, help='A JSON file the results are saved to, to compare runs.')
+    parser.add_argument('--imports', action='store_true', help=f'Only check that the core modules import within {IMPORT_BUDGET} s without the heavy libraries.')
+    args = parser.parse_args()
+
+    if args.imports:
+        imports = min((import_time() for _ in range(args.repeat)), key=lambda result: result['seconds'])
+        print(f'{", ".join(CORE_MODULES)}: {imports["seconds"]:.3f} s (budget {IMPORT_BUDGET} s), heavy modules: {imports["heavy"] or "none"}')
+        sys.exit(0 if imports['seconds'] <= IMPORT_BUDGET and not imports['heavy'] else 1)
+
+    results = benchmark(args.scales, args.data_dir, args.repeat, args.workers, not args.markers, args.seed)
+    print(report(results))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'repeat': args.repeat,
+                       'workers': args.workers, 'geojson': not args.markers, 'results': results}, f, indent=2)
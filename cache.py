@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import pandas as pd
+
+CACHE_VERSION = 2 # Increase when the normalisation changes, so old cache entries are not used any more.
+
+def file_digest(path:str, block_size:int=1 << 20) -> str:
+    """
+    Calculate the SHA-256 digest of a file's content, reading it block by block.
+
+    Arguments:
+    path: The location of the file.
+    block_size: The number of bytes read at a time.
+
+    Returns:
+    The hexadecimal digest.
+    """
+    hash_obj = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hash_obj.update(block)
+    return hash_obj.hexdigest()
+
+class DatasetCache:
+    """
+    Normalised datasets saved as Parquet files, keyed by the content of their source files.
+    A source file which has not changed since its last normalisation is loaded from the cache without being parsed again.
+    """
+    def __init__(self, cache_dir:str):
+        """
+        Parameters:
+        cache_dir: The directory storing the cached datasets.
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.digests = {}
+
+    def digest(self, source:str) -> str:
+        if source not in self.digests:
+            self.digests[source] = file_digest(source)
+        return self.digests[source]
+
+    def location(self, source:str) -> str:
+        return os.path.join(self.cache_dir, f'{self.digest(source)}-v{CACHE_VERSION}')
+
+    def load(self, source:str) -> pd:
+        """
+        Arguments:
+        source: The location of the source file.
+
+        Returns:
+        The cached normalised dataset, with its time column name in dataset.attrs['normalised'], or None if there is no valid entry.
+        """
+        location = self.location(source)
+        if not (os.path.exists(location + '.parquet') and os.path.exists(location + '.json')):
+            return None
+        with open(location + '.json') as f:
+            meta = json.load(f)
+        dataset = pd.read_parquet(location + '.parquet')
+        dataset.attrs['normalised'] = meta['normalised']
+        return dataset
+
+    def store(self, source:str, dataset:pd):
+        """
+        Save a normalised dataset. The metadata file is written last, so an interrupted write is never loaded.
+
+        Arguments:
+        source: The location of the source file the dataset was read from.
+        dataset: The normalised dataset.
+        """
+        location = self.location(source)
+        dataset.to_parquet(location + '.parquet', index=False)
+        with open(location + '.json', 'w') as f:
+            json.dump({'source': source, 'normalised': dataset.attrs['normalised']}, f)
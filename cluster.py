@@ -1,90 +1,213 @@
 from process import GroupedDataset
-from geopy.distance import geodesic
-import folium
-from folium import LayerControl
-from folium import FeatureGroup
-from instances import Trip
-from datetime import timedelta
+import numpy as np
+import pandas as pd
 import tools
 from typing import Tuple
-
-def stops_filter(data:GroupedDataset, filter_names:list, time_shift:int) -> Tuple[dict, dict]:
-    filtered_stops = {}
-    stops_dates = {}
-    
-    for (key_stops, stops) in data.stops.items():
-        stops_name = key_stops.split('-')[1]
-        stops_date = stops[0].time.date().isoformat()
-        stops_dates[stops_date] = 1
-
-        if stops_name in filter_names:
-            for stop in stops:
-                stop.time = stop.time + timedelta(hours=time_shift)
-                if (stops_name, stops_date) not in filtered_stops:
-                    filtered_stops[(stops_name, stops_date)] = [stop]
-                else:
-                    filtered_stops[(stops_name, stops_date)].append(stop)
-
+from keyed_store import KeyedStore
+from instrumentation import stage
+import instances
+
+# Statuses of the stops in the table returned by match_stops_to_trips.
+MATCHED = 'matched'
+BEFORE_FIRST = 'before_first' # The stop happened before the first GPS point of its route.
+AFTER_LAST = 'after_last' # The stop happened after the last GPS point of its route.
+NO_ROUTE = 'no_route' # There is no route for the stop's vehicle and date.
+
+def stops_mask(table:pd, vehicles:list=None, start=None, end=None, cities:list=None) -> np.ndarray:
+    """
+    Select stops with boolean masks over the columns of GroupedDataset.stops_table.
+
+    Arguments:
+    table: The stops table.
+    vehicles: The names of the vehicles. All of them if None.
+    start, end: The first and last dates included. Unbounded if None.
+    cities: The cities of the stops ('Address.City'). All of them if None.
+
+    Returns:
+    A boolean mask over the rows of the table.
+    """
+    mask = np.ones(len(table), dtype=bool)
+    if vehicles is not None:
+        mask &= table['vehicle'].isin(vehicles).to_numpy()
+    if start is not None:
+        mask &= (table['date'] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (table['date'] <= pd.Timestamp(end)).to_numpy()
+    if cities is not None:
+        mask &= table['city'].isin(cities).to_numpy()
+    return mask
+
+@stage(counts=lambda result, **_: {'stops': sum(map(len, result[0].values()))})
+def stops_filter(data:GroupedDataset, filter_names:list=None, *, start=None, end=None, cities:list=None) -> Tuple[KeyedStore, dict]:
+    """
+    Select the stops of some vehicles, dates and cities.
+    The stops are not modified, so the selection can be repeated with the same result. Their times are aligned with the GPS times
+    at ingest, see GroupedDataset.time_normalisation.
+
+    Arguments:
+    data: The dataset organised by stops_organise(['Ruttnamn', 'date']).
+    filter_names, start, end, cities: The vehicles, first and last dates and cities, see stops_mask.
+        start, end and cities are keyword-only, so that a time shift passed in the former third position fails instead of being read as a date.
+
+    Returns:
+    The selected stops {(name, date): [Stop1, Stop2, ...]} in new lists, and the dates of all the stops {date: 1}.
+    """
+    table = data.stops_table
+    if table is None:
+        raise ValueError('stops_filter needs the stops to be organised by the vehicle name and the date.')
+    selected = table[stops_mask(table, filter_names, start, end, cities)]
+    filtered_stops = KeyedStore(prefix=data.stops.prefix)
+    for ((vehicle, day), positions) in selected.groupby(['vehicle', 'date'], sort=False)['position']:
+        stops = data.stops[(vehicle, day.date())]
+        filtered_stops[(vehicle, day.date())] = [stops[position] for position in positions.to_numpy()]
+    stops_dates = dict.fromkeys(table['date'].drop_duplicates().dt.date, 1)
     return filtered_stops, stops_dates
 
-def routes_filter(data:GroupedDataset, stops_dates:dict, filter_names:list) -> dict:
-    filtered_routes = {}
-
-    for (key_route, route) in data.routes.items():
-        route_name = key_route.split('-')[1]
-        route_date = route.trips[0].start.time.date().isoformat()
-        if route_name in filter_names and route_date in stops_dates :
-            filtered_routes[(route_name, route_date)] = route
-
-    return filtered_routes
-
-def nearest_trip_match(stops:list, points:list):
-    i = 0
-    j = 1
-    while i < len(stops) and j < len(points):
-        stop = stops[i]
-        if stop.time >= points[j-1].time and stop.time <= points[j].time:
-            stop.nearest_trip = Trip(points[j-1], points[j])
-            for point in [points[j-1], points[j]]:
-                if point.speed <= 1:
-                    stop.parked_points.append(point)
-            i += 1
-        else:
-            j += 1
-
-def find_nearest_trips(filtered_stops:dict, filtered_routes:dict):
-    for (stop_key, stops) in filtered_stops.items():
-        stop_name = stop_key[0]
-        stop_date = stop_key[1]
-        if (stop_name, stop_date) in filtered_routes:
-            selected_route = filtered_routes[(stop_name, stop_date)]
-            nearest_trip_match(stops, selected_route.points)
-
-stops_csv = 'Datasets/Batch1/POD1.csv'
-routes_csv = 'Datasets/Batch1/GPS1_W904.csv'
-
-delivery_data = GroupedDataset(stops_csv, routes_csv)
-delivery_data.time_normalisation(delivery_data.dataset_routes, 'Tid')
-delivery_data.time_normalisation(delivery_data.dataset_stops, 'DeliveredAt')
-delivery_data.routes_organise(['Name', 'date']) 
-delivery_data.stops_organise(['Ruttnamn', 'date'])
-
-examine_vehicles_names = ['W904']
-
-filtered_stops, stops_dates = stops_filter(delivery_data, examine_vehicles_names, 2)
-corresponding_routes = routes_filter(delivery_data, stops_dates, examine_vehicles_names)
-find_nearest_trips(filtered_stops, corresponding_routes)
-
-map = folium.Map(location=[59.3293, 18.0686], zoom_start=12)
-tools.nearest_trip_plot(filtered_stops, map)
-
-LayerControl().add_to(map)
-map.save('Maps/batch1_nearest_points.html')
-
-
-
-            
-            
-        
-
-
+@stage(counts=lambda result, **_: {'routes': len(result)})
+def routes_filter(data:GroupedDataset, stops_dates:dict, filter_names:list=None, *, start=None, end=None) -> KeyedStore:
+    """
+    Select the routes of some vehicles on the dates with stops.
+
+    Arguments:
+    data: The dataset organised by routes_organise(['Name', 'date']).
+    stops_dates: The dates to keep, as returned by stops_filter.
+    filter_names: The names of the vehicles. All of them if None.
+    start, end: The first and last dates included. Unbounded if None.
+
+    Returns:
+    The selected routes {(name, date): Route}.
+    """
+    return data.routes.select(vehicles=filter_names, start=start, end=end, dates=stops_dates)
+
+@stage(counts=lambda result, **_: {'stops': len(result), 'matched': int((result['status'] == MATCHED).sum())})
+def match_stops_to_trips(filtered_stops:dict, filtered_routes:dict, parked_speed:float=1) -> pd.DataFrame:
+    """
+    Find the pair of GPS points bracketing every stop, for all the vehicles and dates at once.
+    The times of all the routes are concatenated in (route, time) order, the stops are merged into them with one
+    stable sort, and the number of GPS points preceding each stop gives its bracketing pair.
+    Matched stops get their nearest_trip and parked_points (the bracketing points with speed <= parked_speed) assigned.
+
+    Arguments:
+    filtered_stops: Dictionary {(name, date): [Stop1, Stop2, ...]}.
+    filtered_routes: Dictionary {(name, date): Route}.
+    parked_speed: The maximum speed of a point regarded as parked.
+
+    Returns:
+    A table with one row per stop: its key, index in the stop list, status and the indices of the bracketing points in the route.
+    """
+    route_keys = [key for key in filtered_stops if key in filtered_routes]
+    route_ids = {key: i for (i, key) in enumerate(route_keys)}
+    routes = [filtered_routes[key] for key in route_keys]
+    offsets, ping_groups, ping_times, _, _, speeds = instances.Route.concatenate(routes)
+    lengths = np.diff(offsets)
+    ping_times = ping_times.astype(np.int64)
+
+    keys = list(filtered_stops)
+    key_groups, stop_indices, stop_times, _, _, _ = instances.StopList.flatten(filtered_stops)
+    stop_groups = np.array([route_ids.get(key, -1) for key in keys], dtype=np.int64)[key_groups]
+    stop_times = stop_times.astype(np.int64)
+
+    # Stops are ordered before points of the same time, so the count of preceding points is a left-sided searchsorted.
+    n_pings = len(ping_times)
+    all_times = np.concatenate((ping_times, stop_times))
+    all_groups = np.concatenate((ping_groups, stop_groups))
+    kinds = np.concatenate((np.ones(n_pings, dtype=np.int8), np.zeros(len(stop_times), dtype=np.int8)))
+    order = np.lexsort((kinds, all_times, all_groups))
+    preceding = np.cumsum(order < n_pings)
+    next_ping = np.empty(len(stop_times), dtype=np.int64)
+    stop_positions = np.nonzero(order >= n_pings)[0]
+    next_ping[order[stop_positions] - n_pings] = preceding[stop_positions]
+
+    status = np.full(len(stop_times), NO_ROUTE, dtype=object)
+    start_local = np.full(len(stop_times), -1, dtype=np.int64)
+    start_parked = np.zeros(len(stop_times), dtype=bool)
+    end_parked = np.zeros(len(stop_times), dtype=bool)
+    has_route = stop_groups >= 0
+    if has_route.any():
+        groups = stop_groups[has_route]
+        first = offsets[groups]
+        n_local = lengths[groups]
+        local = next_ping[has_route] - first
+        times = stop_times[has_route]
+        # A stop at exactly the time of the first point belongs to the first trip, as in the original two-pointer search.
+        on_first = (local == 0) & (n_local >= 2) & (times == ping_times[first])
+        group_status = np.full(len(groups), MATCHED, dtype=object)
+        group_status[(local == 0) & ~on_first] = BEFORE_FIRST
+        group_status[local >= n_local] = AFTER_LAST
+        status[has_route] = group_status
+
+        group_start = np.where(on_first, 0, local - 1)
+        group_matched = group_status == MATCHED
+        matched_rows = np.nonzero(has_route)[0][group_matched]
+        start_local[matched_rows] = group_start[group_matched]
+
+        # Speed filter of the bracketing points as masks over the concatenated speeds.
+        matched_first = first[group_matched] + group_start[group_matched]
+        start_parked[matched_rows] = speeds[matched_first] <= parked_speed
+        end_parked[matched_rows] = speeds[matched_first + 1] <= parked_speed
+
+    matched = status == MATCHED
+    end_local = np.where(matched, start_local + 1, -1)
+
+    stop_keys = [keys[group] for group in key_groups.tolist()]
+    for (i, index) in enumerate(stop_indices.tolist()):
+        stop = filtered_stops[stop_keys[i]][index]
+        stop.nearest_trip = None
+        stop.parked_points = []
+        if matched[i]:
+            route = filtered_routes[stop_keys[i]]
+            trip = route.trip(int(start_local[i]))
+            stop.nearest_trip = trip
+            if start_parked[i]:
+                stop.parked_points.append(trip.start)
+            if end_parked[i]:
+                stop.parked_points.append(trip.end)
+
+    return pd.DataFrame({
+        'name': [key[0] for key in stop_keys],
+        'date': [key[1] for key in stop_keys],
+        'stop_index': stop_indices,
+        'status': status,
+        'start_index': start_local,
+        'end_index': end_local,
+    })
+
+@stage()
+def find_nearest_trips(filtered_stops:dict, filtered_routes:dict) -> pd.DataFrame:
+    """
+    Match every filtered stop to the trip of its vehicle and date during which it happened.
+
+    Arguments:
+    filtered_stops: Dictionary {(name, date): [Stop1, Stop2, ...]}.
+    filtered_routes: Dictionary {(name, date): Route}. The routes are looked up by the keys of the stops,
+        so the whole GroupedDataset.routes store can be given instead of the output of routes_filter.
+
+    Returns:
+    The matching table of match_stops_to_trips, including the unmatched stops.
+    """
+    return match_stops_to_trips(filtered_stops, filtered_routes)
+
+if __name__ == '__main__':
+    import folium
+    from folium import LayerControl
+
+    stops_csv = 'Datasets/Batch1/POD1.csv'
+    routes_csv = 'Datasets/Batch1/GPS1_W904.csv'
+
+    delivery_data = GroupedDataset(stops_csv, routes_csv)
+    delivery_data.time_normalisation(delivery_data.dataset_routes, 'Tid')
+    delivery_data.time_normalisation(delivery_data.dataset_stops, 'DeliveredAt', time_shift=2)
+    delivery_data.routes_organise(['Name', 'date']) 
+    delivery_data.stops_organise(['Ruttnamn', 'date'])
+
+    examine_vehicles_names = ['W904']
+
+    filtered_stops, stops_dates = stops_filter(delivery_data, examine_vehicles_names)
+    corresponding_routes = routes_filter(delivery_data, stops_dates, examine_vehicles_names)
+    find_nearest_trips(filtered_stops, corresponding_routes)
+
+    map = folium.Map(location=[59.3293, 18.0686], zoom_start=12)
+    tools.nearest_trip_plot(filtered_stops, map)
+
+    LayerControl().add_to(map)
+    map.save('Maps/batch1_nearest_points.html')
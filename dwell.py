@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import metrics
+import instances
+
+def detect_dwells(routes:dict, max_speed:float=1, max_step:float=30, min_duration:float=60) -> pd.DataFrame:
+    """
+    Find the stationary periods of all the routes at once.
+    A point is stationary if its speed is at most max_speed and it moved at most max_step meters since the previous point.
+    Runs of stationary points are run-length encoded over the concatenated arrays of all the routes, breaking at route boundaries.
+
+    Arguments:
+    routes: A dictionary of columnar routes, e.g. GroupedDataset.routes or the output of cluster.routes_filter.
+    max_speed: The maximum speed of a stationary point, in the unit of the 'Hastighet' column (km/h).
+    max_step: The maximum displacement from the previous point, in meters.
+    min_duration: The minimum duration of a dwell, in seconds.
+
+    Returns:
+    A table with one row per dwell: the route key, the indices of its first and last points in the route,
+    its start and end times, duration in seconds, number of points and centroid.
+    """
+    columns = ['route', 'start_index', 'end_index', 'start_time', 'end_time', 'duration', 'points', 'lat', 'lon']
+    keys = list(routes)
+    if not keys:
+        return pd.DataFrame(columns=columns)
+    offsets, groups, times, lats, lons, speeds = instances.Route.concatenate([routes[key] for key in keys])
+    offsets = offsets[:-1]
+    # The first point of every route has no previous point, so only its speed counts.
+    steps = np.concatenate([np.concatenate(([0.0], routes[key].trip_distances * 1000)) for key in keys])
+
+    stationary = (speeds <= max_speed) & (steps <= max_step)
+    first_of_route = np.zeros(len(times), dtype=bool)
+    first_of_route[offsets] = True
+    previous = np.concatenate(([False], stationary[:-1]))
+    run_starts = np.nonzero(stationary & (~previous | first_of_route))[0]
+    # A run ends before the next run start, the next non-stationary point or the next route, whichever comes first.
+    breaks = np.nonzero(~stationary | first_of_route)[0]
+    run_ends = np.concatenate((breaks, [len(times)]))[np.searchsorted(breaks, run_starts, side='right')] - 1
+
+    durations = (times[run_ends] - times[run_starts]).astype('timedelta64[ns]').astype(np.int64) / 1e9
+    keep = durations >= min_duration
+    run_starts, run_ends, durations = run_starts[keep], run_ends[keep], durations[keep]
+    counts = run_ends - run_starts + 1
+    # Sums over each run from the prefix sums, for the centroids.
+    lat_cum = np.concatenate(([0.0], np.cumsum(lats)))
+    lon_cum = np.concatenate(([0.0], np.cumsum(lons)))
+    lat_sums = lat_cum[run_ends + 1] - lat_cum[run_starts]
+    lon_sums = lon_cum[run_ends + 1] - lon_cum[run_starts]
+
+    route_ids = groups[run_starts]
+    return pd.DataFrame({
+        'route': [keys[i] for i in route_ids],
+        'start_index': run_starts - offsets[route_ids],
+        'end_index': run_ends - offsets[route_ids],
+        'start_time': times[run_starts],
+        'end_time': times[run_ends],
+        'duration': durations,
+        'points': counts,
+        'lat': lat_sums / np.maximum(counts, 1),
+        'lon': lon_sums / np.maximum(counts, 1),
+    }, columns=columns)
+
+def match_dwells(dwells:pd.DataFrame, stops:dict, tolerance:float=300) -> pd.DataFrame:
+    """
+    Match every stop to the closest dwell of its route overlapping the stop time.
+
+    Arguments:
+    dwells: The table of detect_dwells.
+    stops: A dictionary {key: [Stop1, Stop2, ...]} with the same keys as the routes given to detect_dwells.
+    tolerance: The number of seconds a dwell may end before or start after the stop time.
+
+    Returns:
+    A table with one row per stop: its key, index in the stop list, the row of the matched dwell in dwells (-1 if none)
+    and the distance between the stop and the dwell centroid in meters.
+    """
+    keys = list(stops)
+    key_ids, stop_indices, times, lats, lons, _ = instances.StopList.flatten(stops)
+    stop_table = pd.DataFrame({
+        'stop': [keys[i] for i in key_ids.tolist()],
+        'stop_index': stop_indices,
+        'time': times,
+        'stop_lat': lats,
+        'stop_lon': lons,
+        # Tuple keys cannot be merged on directly, so both sides are joined through their position in the stops dictionary.
+        'key_id': key_ids,
+    })
+    stop_table['row'] = np.arange(len(stop_table))
+    positions = {key: i for (i, key) in enumerate(keys)}
+    candidates = dwells.reset_index(names='dwell')
+    candidates['key_id'] = [positions.get(key, -1) for key in candidates['route']]
+    candidates = stop_table.merge(candidates[candidates['key_id'] >= 0], on='key_id')
+
+    tolerance = pd.Timedelta(seconds=tolerance)
+    candidates = candidates[(candidates['start_time'] - tolerance <= candidates['time']) & (candidates['time'] <= candidates['end_time'] + tolerance)].copy()
+    candidates['distance'] = metrics.haversine(candidates['stop_lat'].to_numpy(), candidates['stop_lon'].to_numpy(),
+                                               candidates['lat'].to_numpy(), candidates['lon'].to_numpy()) * 1000
+    best = candidates.sort_values('distance').drop_duplicates('row').set_index('row')
+
+    result = stop_table[['stop', 'stop_index']].copy()
+    result['dwell'] = best['dwell'].reindex(stop_table['row']).fillna(-1).astype(np.int64).to_numpy()
+    result['distance'] = best['distance'].reindex(stop_table['row']).to_numpy()
+    return result
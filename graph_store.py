@@ -0,0 +1,231 @@
+import os
+import json
+import math
+import heapq
+import pickle
+from collections import OrderedDict
+import numpy as np
+import networkx as nx
+import osmnx as ox
+from scipy.spatial import cKDTree
+import metrics
+
+INDEX_FILE = 'index.json'
+
+def merge_graph(G:nx.MultiDiGraph, G_sub:nx.MultiDiGraph) -> nx.MultiDiGraph:
+    """
+    Add the nodes and edges of G_sub which are not yet in G into G.
+
+    Arguments:
+    G: The graph to be extended.
+    G_sub: The graph providing new nodes and edges.
+
+    Returns:
+    The extended graph G.
+    """
+    for node, data in G_sub.nodes(data=True):
+        if node not in G:
+            G.add_node(node, **data)
+    for u, v, key, data in G_sub.edges(keys=True, data=True):
+        if not G.has_edge(u, v, key):
+            G.add_edge(u, v, key=key, **data)
+    return G
+
+def shortest_paths(G:nx.MultiDiGraph, source, targets, weight:str='length') -> dict:
+    """
+    The shortest paths from one node to several, found with a single Dijkstra search which stops once every target is reached.
+    Parallel edges count with their smallest weight, and edges without the weight with 1, as in networkx.
+
+    Arguments:
+    G: The graph.
+    source: The start node.
+    targets: The end nodes.
+    weight: The edge attribute to minimise.
+
+    Returns:
+    A dictionary {target: [source, ..., target]}, without the targets which cannot be reached.
+    """
+    remaining = set(targets)
+    distances = {source: 0}
+    parents = {source: None}
+    settled = set()
+    paths = {}
+    # The counter breaks ties between equal distances, so that nodes are never compared.
+    queue = [(0, 0, source)]
+    pushed = 1
+    while queue and remaining:
+        (distance, _, node) = heapq.heappop(queue)
+        if node in settled:
+            continue
+        settled.add(node)
+        if node in remaining:
+            remaining.discard(node)
+            path = [node]
+            while parents[path[-1]] is not None:
+                path.append(parents[path[-1]])
+            paths[node] = path[::-1]
+        for (neighbour, edges) in G.succ[node].items():
+            candidate = distance + min(data.get(weight, 1) for data in edges.values())
+            if neighbour not in settled and candidate < distances.get(neighbour, math.inf):
+                distances[neighbour] = candidate
+                parents[neighbour] = node
+                heapq.heappush(queue, (candidate, pushed, neighbour))
+                pushed += 1
+    return paths
+
+class GraphStore:
+    """
+    A road graph of a region saved on disk in square tiles, so that subgraphs can be served without network access.
+    Every tile holds the nodes located in it, the edges leaving them and the end nodes of those edges.
+    """
+    def __init__(self, store_dir:str, cache_size:int=64):
+        """
+        Parameters:
+        store_dir: The directory written by GraphStore.build.
+        cache_size: The number of tiles kept in memory.
+        """
+        with open(os.path.join(store_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+        self.store_dir = store_dir
+        self.tile_size = index['tile_size']
+        self.graph_attrs = index['graph_attrs']
+        self.tiles = {tuple(map(int, key.split(','))): file for (key, file) in index['tiles'].items()}
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    @classmethod
+    def build(cls, source:str, store_dir:str, tile_size:float=0.02, network_type:str='drive_service') -> 'GraphStore':
+        """
+        Read the road graph of a region once, split it into tiles and save them into store_dir.
+
+        Arguments:
+        source: A .graphml file, or an .osm/.xml file exported from OpenStreetMap.
+        store_dir: The directory to save the tiles into.
+        tile_size: The side of a tile in degrees.
+        network_type: Unused for GraphML sources. Kept in the index to document how the graph was obtained.
+
+        Returns:
+        The built store.
+        """
+        if source.endswith('.graphml'):
+            G = ox.load_graphml(source)
+        else:
+            G = ox.graph_from_xml(source, simplify=False, retain_all=True)
+
+        tile_nodes = {}
+        for node, data in G.nodes(data=True):
+            tile_nodes.setdefault(cls.tile_of(data['y'], data['x'], tile_size), []).append(node)
+
+        os.makedirs(store_dir, exist_ok=True)
+        tiles = {}
+        for (tile, nodes) in tile_nodes.items():
+            T = nx.MultiDiGraph(**G.graph)
+            for node in nodes:
+                T.add_node(node, **G.nodes[node])
+            for u, v, key, data in G.out_edges(nodes, keys=True, data=True):
+                if v not in T:
+                    T.add_node(v, **G.nodes[v])
+                T.add_edge(u, v, key=key, **data)
+            file = f'tile_{tile[0]}_{tile[1]}.pkl'
+            with open(os.path.join(store_dir, file), 'wb') as f:
+                pickle.dump(T, f, protocol=pickle.HIGHEST_PROTOCOL)
+            tiles[f'{tile[0]},{tile[1]}'] = file
+
+        graph_attrs = {key: value for (key, value) in G.graph.items() if isinstance(value, (str, int, float))}
+        graph_attrs['network_type'] = network_type
+        with open(os.path.join(store_dir, INDEX_FILE), 'w') as f:
+            json.dump({'tile_size': tile_size, 'graph_attrs': graph_attrs, 'tiles': tiles}, f)
+        return cls(store_dir)
+
+    @staticmethod
+    def tile_of(lat:float, lon:float, tile_size:float) -> tuple:
+        return (math.floor(lat / tile_size), math.floor(lon / tile_size))
+
+    def load_tile(self, tile:tuple) -> nx.MultiDiGraph:
+        """
+        Read a tile from disk, or from the in-memory cache if it was used recently.
+        """
+        if tile in self.cache:
+            self.cache.move_to_end(tile)
+            return self.cache[tile]
+        with open(os.path.join(self.store_dir, self.tiles[tile]), 'rb') as f:
+            T = pickle.load(f)
+        self.cache[tile] = T
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return T
+
+    def subgraph(self, north:float, south:float, east:float, west:float) -> nx.MultiDiGraph:
+        """
+        Compose the tiles intersecting a bounding box into one graph.
+
+        Arguments:
+        north, south, east, west: The bounding box in degrees.
+
+        Returns:
+        The graph made of the tiles, possibly extending beyond the bounding box. Empty if the box is outside the region.
+        """
+        G = nx.MultiDiGraph(**self.graph_attrs)
+        south_west = self.tile_of(south, west, self.tile_size)
+        north_east = self.tile_of(north, east, self.tile_size)
+        for i in range(south_west[0], north_east[0] + 1):
+            for j in range(south_west[1], north_east[1] + 1):
+                if (i, j) in self.tiles:
+                    merge_graph(G, self.load_tile((i, j)))
+        return G
+
+    def graph_from_point(self, loc:list, dist:float) -> nx.MultiDiGraph:
+        """
+        The offline counterpart of ox.graph_from_point.
+
+        Arguments:
+        loc: [lat, lon] of the center.
+        dist: The half side of the bounding box in meters.
+        """
+        radius = metrics.EARTH_RADIUS * 1000
+        dlat = math.degrees(dist / radius)
+        dlon = math.degrees(dist / (radius * max(math.cos(math.radians(loc[0])), 1e-12)))
+        return self.subgraph(loc[0] + dlat, loc[0] - dlat, loc[1] + dlon, loc[1] - dlon)
+
+class NodeIndex:
+    """
+    A KD-tree over the nodes of a graph, for snapping many coordinates to their nearest nodes in one query.
+    Coordinates are projected to meters with an equirectangular projection around the mean latitude of the nodes,
+    which is accurate enough at the scale of a city.
+    """
+    def __init__(self, G:nx.MultiDiGraph):
+        """
+        Parameters:
+        G: A graph whose nodes carry 'x' (longitude) and 'y' (latitude) attributes.
+        """
+        lats = np.array([data['y'] for (_, data) in G.nodes(data=True)], dtype=float)
+        lons = np.array([data['x'] for (_, data) in G.nodes(data=True)], dtype=float)
+        self.build(np.array(list(G.nodes)), lats, lons)
+
+    @classmethod
+    def from_coordinates(cls, nodes:np.ndarray, lats:np.ndarray, lons:np.ndarray) -> 'NodeIndex':
+        """
+        An index over nodes given as arrays, e.g. the positions of the nodes of a DistanceOracle.
+        """
+        index = cls.__new__(cls)
+        index.build(np.asarray(nodes), np.asarray(lats, dtype=float), np.asarray(lons, dtype=float))
+        return index
+
+    def build(self, nodes:np.ndarray, lats:np.ndarray, lons:np.ndarray):
+        self.nodes = nodes
+        self.cos_lat = metrics.reference_cos(lats)
+        self.tree = cKDTree(self.project(lats, lons))
+
+    def project(self, lats:np.ndarray, lons:np.ndarray) -> np.ndarray:
+        return np.column_stack(metrics.project(lats, lons, self.cos_lat))
+
+    def nearest(self, lats:np.ndarray, lons:np.ndarray) -> tuple:
+        """
+        Arguments:
+        lats, lons: Coordinates to be snapped, in degrees.
+
+        Returns:
+        The nearest node of every coordinate, and the distances to them in meters.
+        """
+        distances, positions = self.tree.query(self.project(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)))
+        return self.nodes[positions], distances
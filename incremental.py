@@ -0,0 +1,83 @@
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+
+MANIFEST_FILE = 'manifest.json'
+STATE_VERSION = 5 # Increase when the layout of the stored results changes, so that older results are built again.
+
+def data_digest(data:pd) -> str:
+    """
+    A digest of the content of a dataset, computed with pandas' vectorised row hashing.
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes()).hexdigest()
+
+class PartitionStore:
+    """
+    The results of previous runs per partition (e.g. per vehicle and date), saved on disk with a watermark:
+    the number of rows and the latest time of the partition when it was processed.
+    A partition whose watermark has not moved is taken from the store instead of being processed again.
+    """
+    def __init__(self, state_dir:str):
+        """
+        Parameters:
+        state_dir: The directory storing the manifest and the pickled results.
+        """
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        manifest = os.path.join(state_dir, MANIFEST_FILE)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    @staticmethod
+    def key_of(group_keys:tuple) -> str:
+        return json.dumps([str(key) for key in group_keys])
+
+    def entry(self, kind:str, group_keys:tuple) -> dict:
+        """
+        The manifest entry {'version', 'rows', 'last_time', 'digest', 'file'} of a partition, or None.
+        """
+        return self.manifest.get(kind, {}).get(self.key_of(group_keys))
+
+    def unchanged(self, kind:str, group_keys:tuple, rows:int, last_time:pd.Timestamp, data:pd=None) -> bool:
+        """
+        Whether a partition can be taken from the store.
+
+        Arguments:
+        kind: The kind of results, e.g. 'routes' or 'stops'.
+        group_keys: The keys of the partition.
+        rows, last_time: The current watermark of the partition.
+        data: The rows of the partition. If given, their digest is compared as well, which also detects rows edited in place.
+        """
+        entry = self.entry(kind, group_keys)
+        if entry is None or entry.get('version') != STATE_VERSION or entry['rows'] != rows or entry['last_time'] != str(last_time):
+            return False
+        return data is None or entry['digest'] == data_digest(data)
+
+    def load(self, kind:str, group_keys:tuple):
+        with open(os.path.join(self.state_dir, self.entry(kind, group_keys)['file']), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, kind:str, group_keys:tuple, result, data:pd, last_time:pd.Timestamp):
+        """
+        Save the result of a partition and move its watermark. The manifest is only written by commit.
+        """
+        key = self.key_of(group_keys)
+        file = os.path.join(kind, hashlib.sha1(key.encode()).hexdigest() + '.pkl')
+        os.makedirs(os.path.join(self.state_dir, kind), exist_ok=True)
+        with open(os.path.join(self.state_dir, file), 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.manifest.setdefault(kind, {})[key] = {'version': STATE_VERSION, 'rows': len(data), 'last_time': str(last_time), 'digest': data_digest(data), 'file': file}
+
+    def commit(self):
+        """
+        Write the manifest, replacing the previous one atomically.
+        """
+        path = os.path.join(self.state_dir, MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(path + '.tmp', path)
@@ -1,53 +1,219 @@
+from __future__ import annotations
+import sys
+import numpy as np
 import pandas as pd
 from datetime import timedelta
-import osmnx as ox
-from geopy.distance import geodesic
+import warnings
+from typing import TYPE_CHECKING
 from tools import get_color
+import metrics
+from instrumentation import stage
+
+# The road network libraries are only imported when trips are matched to the roads.
+if TYPE_CHECKING:
+    import osmnx as ox
+    import networkx as nx
+    from graph_store import GraphStore
+    from oracle import DistanceOracle
 
 class Stop:
     """
     Each delivery destionation.
+    A lightweight view of one stop stored inside a columnar StopList, reading its attributes from the list's arrays on demand.
+    The matching results are kept in the list too, so every view of the same stop sees them.
     """
-    def __init__(self, record:pd):
+    __slots__ = ('stops', 'index')
+    type = 'Destination'
+    color = 'red'
+
+    def __init__(self, stops:StopList, index:int):
         """
         Parameters:
-        record: A line of data read by Pandas.
+        stops: The list holding the stop.
+        index: The position of the stop in the list's arrays.
+        """
+        self.stops = stops
+        self.index = index
+
+    @property
+    def time(self) -> pd.Timestamp:
+        return pd.Timestamp(self.stops.times[self.index])
+
+    @property
+    def loc(self) -> list:
+        return [self.stops.lats[self.index], self.stops.lons[self.index]]
+
+    @property
+    def city(self) -> str:
+        return self.stops.city_names[self.stops.city_codes[self.index]]
+
+    @property
+    def nearest_trip(self) -> Trip:
+        return self.stops.nearest_trips[self.index]
+
+    @nearest_trip.setter
+    def nearest_trip(self, trip:Trip):
+        self.stops.nearest_trips[self.index] = trip
+
+    @property
+    def parked_points(self) -> list:
+        # The lists are only created for the stops whose points are asked for, usually the matched ones.
+        if self.stops.parked_points[self.index] is None:
+            self.stops.parked_points[self.index] = []
+        return self.stops.parked_points[self.index]
+
+    @parked_points.setter
+    def parked_points(self, points:list):
+        self.stops.parked_points[self.index] = points
+
+class StopList:
+    """
+    The stops of one group, sorted according to their times and kept column-wise in NumPy arrays.
+    It behaves like a list of Stop, whose views are only created when an element is accessed.
+    """
+    def __init__(self, data:pd):
+        """
+        Parameters:
+        data: The stops of the group sorted according to their times, read using Pandas.
+        """
+        self.times = data['timevalue'].to_numpy(dtype='datetime64[ns]')
+        self.lats = data['ConfirmedCoordinates.Latitude'].to_numpy(dtype=float)
+        self.lons = data['ConfirmedCoordinates.Longitude'].to_numpy(dtype=float)
+        codes, names = pd.factorize(data['Address.City'])
+        # Missing cities have the code -1 and take the NaN appended at the end.
+        self.city_names = np.array([sys.intern(str(name)) for name in names] + [np.nan], dtype=object)
+        self.city_codes = codes.astype(np.int16 if len(names) < 2**15 else np.int64)
+        self.nearest_trips = [None] * len(self.times) # Filled by cluster.match_stops_to_trips.
+        self.parked_points = [None] * len(self.times)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Stop(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('stop index out of range')
+        return Stop(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Stop(self, i)
+
+    @staticmethod
+    def flatten(stops:dict) -> tuple:
+        """
+        Concatenates the stops of many groups into arrays with one element per stop, reading the columns of the StopLists directly.
+        Lists of Stop views, e.g. the output of cluster.stops_filter, are gathered from the StopLists they view.
+
+        Arguments:
+        stops: A dictionary {key: StopList or [Stop1, Stop2, ...]}.
+
+        Returns:
+        The position of the key of every stop in the dictionary, its index in its list, its time (datetime64[ns]), latitude,
+        longitude and nearest trip.
         """
-        self.time = record['timevalue'] 
-        self.type = 'Destination'
-        self.color = 'red'
-        self.loc = [record['ConfirmedCoordinates.Latitude'], record['ConfirmedCoordinates.Longitude']]
-        self.city = record['Address.City']
-        self.nearest_trip = None
-        self.parked_points = []
+        segments = [] # (group, owner StopList, positions in the owner) for every run of stops viewing the same list.
+        for (group, stop_list) in enumerate(stops.values()):
+            if isinstance(stop_list, StopList):
+                segments.append((group, stop_list, np.arange(len(stop_list))))
+                continue
+            owners = [stop.stops for stop in stop_list]
+            positions = np.array([stop.index for stop in stop_list], dtype=np.int64)
+            starts = [i for i in range(len(owners)) if i == 0 or owners[i] is not owners[i-1]]
+            for (start, end) in zip(starts, starts[1:] + [len(owners)]):
+                segments.append((group, owners[start], positions[start:end]))
+
+        lengths = [len(positions) for (_, _, positions) in segments]
+        groups = np.repeat(np.array([group for (group, _, _) in segments], dtype=np.int64), lengths)
+        indices = np.concatenate([np.arange(len(stop_list)) for stop_list in stops.values()]).astype(np.int64) if stops else np.empty(0, dtype=np.int64)
+        if not segments:
+            return (groups, indices, np.empty(0, dtype='datetime64[ns]'), np.empty(0), np.empty(0), np.empty(0, dtype=object))
+        times = np.concatenate([owner.times[positions] for (_, owner, positions) in segments]).astype('datetime64[ns]')
+        lats = np.concatenate([owner.lats[positions] for (_, owner, positions) in segments])
+        lons = np.concatenate([owner.lons[positions] for (_, owner, positions) in segments])
+        nearest_trips = np.empty(len(times), dtype=object)
+        nearest_trips[:] = [owner.nearest_trips[i] for (_, owner, positions) in segments for i in positions.tolist()]
+        return (groups, indices, times, lats, lons, nearest_trips)
 
-class Info_point:
+class PointView:
     """
-    Each information state point uploaded in the GPS information file.
+    A lightweight view of one information point uploaded in the GPS information file, stored inside a columnar Route.
+    Its attributes time, type, color, loc and speed are read from the route's arrays on demand.
     """
-    def __init__(self, record:pd):
+    __slots__ = ('route', 'index')
+
+    def __init__(self, route, index:int):
         """
         Parameters:
-        record: A line of data read by Pandas.
-        """
-        self.time = record['timevalue'] 
-        self.type = record['Händelse']
-        self.color = get_color(self.type)
-        self.loc = [record['Lat'], record['Long']]
-        self.speed = record['Hastighet']
-        
+        route: The route holding the point.
+        index: The position of the point in the route's arrays.
+        """
+        self.route = route
+        self.index = index
+
+    @property
+    def time(self) -> pd.Timestamp:
+        return pd.Timestamp(self.route.times[self.index])
+
+    @property
+    def type(self) -> str:
+        return self.route.type_names[self.route.type_codes[self.index]]
+
+    @property
+    def color(self) -> str:
+        return get_color(self.type)
+
+    @property
+    def loc(self) -> list:
+        return [self.route.lats[self.index], self.route.lons[self.index]]
+
+    @property
+    def speed(self) -> float:
+        return self.route.speeds[self.index]
+
+class RoutePoints:
+    """
+    The sequence of points of a columnar Route. PointViews are only created when an element is accessed.
+    """
+    __slots__ = ('route',)
+
+    def __init__(self, route):
+        self.route = route
+
+    def __len__(self) -> int:
+        return len(self.route.times)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [PointView(self.route, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('route point index out of range')
+        return PointView(self.route, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield PointView(self.route, i)
+
 class Trip:
     """
     Route between two stops.
     """
-    def __init__(self, start:Info_point, end:Info_point):
+    __slots__ = ('start', 'end', 'distance', 'travel_time', 'speed', 'exact_path')
+
+    def __init__(self, start:PointView, end:PointView, distance:float=None):
         """
         Parameters:
         start, end: The start and end points.
+        distance: The distance in km if it is already known, e.g. calculated by metrics.trip_metrics.
         """
         self.start = start
         self.end = end
-        self.distance = None
+        self.distance = distance
         self.travel_time = None
         self.speed = None
         self.exact_path = None
@@ -55,24 +221,38 @@ class Trip:
 
     def get_properties(self):
         self.travel_time = self.end.time - self.start.time # In pandas time values format.
-        self.distance = geodesic(self.start.loc, self.end.loc).meters/1000
+        if self.distance is None:
+            from geopy.distance import geodesic
+            self.distance = geodesic(self.start.loc, self.end.loc).meters/1000
 
         if self.travel_time.total_seconds() == 0:
             self.speed = 0
         else:
             self.speed = self.distance / (self.travel_time.total_seconds()/3600)
 
-    def get_exact_path(self, G) -> ox.graph:
+    @stage()
+    def get_exact_path(self, G, store:GraphStore=None, oracle:DistanceOracle=None) -> ox.graph:
         """
         Given the start and the end location, this function matches each route into exact routes.
 
         Arguments:
         G: The graph of the city containing road information and coordinates.
+        store: A GraphStore of the region. If given, the graph around the points is read from disk instead of downloaded.
+        oracle: A DistanceOracle of the region. If given, the path is searched in it and only the nodes of the path are added to G.
 
         Returns:
         The extended graph G.
         """
-        existing_nodes = set(G.nodes)
+        import osmnx as ox
+        from osmnx._errors import InsufficientResponseError, ResponseStatusCodeError
+        from requests import RequestException
+        from graph_store import merge_graph
+
+        if oracle is not None:
+            self.exact_path = oracle.route(self.start.loc, self.end.loc)
+            if self.exact_path is not None:
+                merge_graph(G, oracle.graph(self.exact_path))
+            return G
 
         for stop in (self.start, self.end):
             if self.distance != 0:
@@ -80,17 +260,15 @@ class Trip:
             else:
                 dist = 100
 
+            if store is not None:
+                merge_graph(G, store.graph_from_point(stop.loc, dist))
+                continue
             try:
                 G_sub = ox.graph_from_point(stop.loc, dist=dist, network_type='drive_service', simplify=False, truncate_by_edge=True)
-                for node, data in G_sub.nodes(data=True):
-                    if node not in existing_nodes:
-                        G.add_node(node, **data)
-                        existing_nodes.add(node)
-                    for u, v, key, data in G_sub.edges(keys=True, data=True):
-                        if not G.has_edge(u, v, key):
-                            G.add_edge(u, v, key=key, **data)
-            except:
-                pass
+            except (InsufficientResponseError, ResponseStatusCodeError, ValueError, RequestException) as error:
+                warnings.warn(f'Could not download the graph around {stop.loc}: {error}')
+                continue
+            merge_graph(G, G_sub)
 
         start_node = ox.distance.nearest_nodes(G, X=self.start.loc[1], Y=self.start.loc[0])
         stop_node = ox.distance.nearest_nodes(G, X=self.end.loc[1], Y=self.end.loc[0])
@@ -102,18 +280,35 @@ class Trip:
 class Route:
     """
     Contains all the trips travelled by a single vehicle.
+    The information points are kept column-wise in NumPy arrays, and point and trip objects are only built on demand.
     """
-    def __init__(self, name:str, data:pd):
+    def __init__(self, name:str, data:pd, distance_method:str='ellipsoidal', keep_data:bool=False):
         """
         Parameters:
         name: The name of this route.
-        data: All the saved information of this route, read using Pandas. 
+        data: All the saved information of this route sorted according to arrival times, read using Pandas. 
+        distance_method: 'ellipsoidal' or 'haversine', see metrics.trip_metrics.
+        keep_data: Whether data is kept in self.data after its columns are extracted.
+            It is dropped by default, as it holds every column of the dataset and would be copied along with the route
+            to the worker processes, the partition store and the pipeline cache.
         """
         self.name = name   
         self.color = get_color(self.name)
         self.data = data
-        self.points = self.points_extraction() # [Info_point1, Info_point2 ...] sorted according to arrival times.
-        self.trips = self.trips_creation() # [Trip1, Trip2, ...] sorted according to arrival times.
+        self.times = None # datetime64[ns] array of arrival times.
+        self.lats = None
+        self.lons = None
+        self.speeds = None
+        self.type_codes = None # Position of the type of every point in type_names.
+        self.type_names = None # The distinct event types, interned.
+        self.points_extraction()
+        if not keep_data:
+            self.data = None
+        self.distance_method = distance_method
+        self.trip_distances = None # Per-trip distances in km, calculated in one pass by get_properties.
+        self.trip_times = None # Per-trip travel times in seconds.
+        self.trip_speeds = None # Per-trip speeds in km/h.
+        self._trips = None
         self.total_distance = None
         self.total_time = None 
         self.avg_speed = None
@@ -121,18 +316,62 @@ class Route:
 
     def points_extraction(self):
         """
-        Reads and creates all the information points in a route and stores them into a list.
+        Reads the columns of all the information points in a route and stores them into arrays.
+        """
+        self.times = self.data['timevalue'].to_numpy(dtype='datetime64[ns]')
+        self.lats = self.data['Lat'].to_numpy(dtype=float)
+        self.lons = self.data['Long'].to_numpy(dtype=float)
+        self.speeds = self.data['Hastighet'].to_numpy(dtype=float)
+        codes, names = pd.factorize(self.data['Händelse'])
+        # Missing types have the code -1 and take the NaN appended at the end.
+        self.type_names = np.array([sys.intern(str(name)) for name in names] + [np.nan], dtype=object)
+        self.type_codes = codes.astype(np.int16 if len(names) < 2**15 else np.int64)
 
-        Parameters:
-        data: Data of a route, read by Pandas.
+    @staticmethod
+    def concatenate(routes:list) -> tuple:
+        """
+        Concatenates the information points of many routes into arrays with one element per point.
+
+        Arguments:
+        routes: A list of routes.
+
+        Returns:
+        The offsets of the routes in the arrays (with the total number of points appended), the position of the route of
+        every point in the list, and the times (datetime64[ns]), latitudes, longitudes and speeds of the points.
+        """
+        lengths = np.array([len(route.times) for route in routes], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        groups = np.repeat(np.arange(len(routes), dtype=np.int64), lengths)
+        if not routes:
+            return (offsets, groups, np.empty(0, dtype='datetime64[ns]'), np.empty(0), np.empty(0), np.empty(0))
+        times = np.concatenate([route.times for route in routes]).astype('datetime64[ns]')
+        lats = np.concatenate([route.lats for route in routes])
+        lons = np.concatenate([route.lons for route in routes])
+        speeds = np.concatenate([route.speeds for route in routes])
+        return (offsets, groups, times, lats, lons, speeds)
+
+    @property
+    def types(self) -> np.ndarray:
+        """
+        The event type of every point.
+        """
+        return self.type_names[self.type_codes]
+
+    @property
+    def points(self) -> RoutePoints:
+        """
+        [PointView1, PointView2 ...] sorted according to arrival times.
+        """
+        return RoutePoints(self)
 
-        Returns: 
-        A list of points
+    @property
+    def trips(self) -> list:
         """
-        points = []
-        for _, record in self.data.iterrows():
-            points.append(Info_point(record))
-        return points
+        [Trip1, Trip2, ...] sorted according to arrival times, created the first time they are needed.
+        """
+        if self._trips is None:
+            self._trips = self.trips_creation()
+        return self._trips
     
     def trips_creation(self) -> list:
         """
@@ -142,28 +381,89 @@ class Route:
         A list of trips.
         """
         trips = []
-        if len(self.points) >= 2:
-            for i in range(len(self.points) - 1):
-                trip = Trip(self.points[i], self.points[i+1])
-                trips.append(trip)
+        if len(self.times) >= 2:
+            for i in range(len(self.times) - 1):
+                trips.append(self.trip(i))
         return trips
+
+    def trip(self, index:int) -> Trip:
+        """
+        Returns the trip between the point at index and the next one, without creating all the other trips.
+
+        Parameters:
+        index: The position of the start point of the trip.
+        """
+        if self._trips is not None:
+            return self._trips[index]
+        points = self.points
+        return Trip(points[index], points[index+1], distance=float(self.trip_distances[index]))
     
-    def get_properties(self):
+    @stage(counts=lambda result, self, **_: {'trips': len(self.times) - 1})
+    def match_all_trips(self, G:nx.MultiDiGraph=None, store:GraphStore=None, margin:float=0.005, oracle:DistanceOracle=None) -> nx.MultiDiGraph:
         """
-        Calculate the total distance, total time consumed and average speed of this route.
+        Match all the trips of this route into exact paths at once.
+        Every point is snapped to its nearest node with one KD-tree query, so the node shared by two adjacent trips is only looked up once.
+        The pairs of consecutive nodes are grouped by their start node, and one Dijkstra search from every start node
+        gives the paths to all of its end nodes.
+
+        Arguments:
+        G: The graph of the city containing road information and coordinates.
+        store: A GraphStore of the region. If given, the tiles covering the route are added to G (or make up G if it is None).
+        margin: The margin in degrees added around the route when reading the store.
+        oracle: A DistanceOracle of the region. If given, the paths are searched in it instead of in G and store,
+            and the nodes on the paths are added to G (or make up G if it is None), so that they can be drawn.
+
+        Returns:
+        The graph used for matching. The paths are saved into trip.exact_path of each trip, as lists of nodes of this graph.
         """
-        total_distance = 0
-        total_time = timedelta()
+        from graph_store import NodeIndex, merge_graph, shortest_paths
+
+        if oracle is not None:
+            positions = oracle.snap(self.lats, self.lons).tolist()
+            paths = {}
+            for (trip, start, end) in zip(self.trips, positions[:-1], positions[1:]):
+                if (start, end) not in paths:
+                    _, path = oracle.search(start, end)
+                    paths[(start, end)] = oracle.nodes[path].tolist() if path is not None else None
+                trip.exact_path = paths[(start, end)]
+            G_paths = oracle.graph({node for path in paths.values() if path is not None for node in path})
+            return G_paths if G is None else merge_graph(G, G_paths)
 
-        for trip in self.trips:
-            total_distance += trip.distance
-            total_time = total_time + trip.travel_time
+        if G is None and store is None:
+            raise ValueError('match_all_trips needs a graph G, a store or an oracle.')
+        if store is not None:
+            G_route = store.subgraph(self.lats.max() + margin, self.lats.min() - margin, self.lons.max() + margin, self.lons.min() - margin)
+            G = G_route if G is None else merge_graph(G, G_route)
+        if len(self.times) < 2 or len(G) == 0:
+            return G
+
+        nodes, _ = NodeIndex(G).nearest(self.lats, self.lons)
+        starts, ends = nodes[:-1].tolist(), nodes[1:].tolist()
+        targets = {}
+        for (start_node, end_node) in zip(starts, ends):
+            targets.setdefault(start_node, set()).add(end_node)
+        paths = {}
+        for (start_node, end_nodes) in targets.items():
+            found = shortest_paths(G, start_node, end_nodes, weight='length')
+            for end_node in end_nodes:
+                paths[(start_node, end_node)] = found.get(end_node)
+        for (trip, start_node, end_node) in zip(self.trips, starts, ends):
+            trip.exact_path = paths[(start_node, end_node)]
+        return G
 
-        if total_time.total_seconds() == 0:
-            avg_speed = 0
+    def get_properties(self):
+        """
+        Calculate the distance, travel time and speed of every trip, and the total distance, total time consumed and average speed of this route, in one vectorised pass.
+        """
+        if len(self.times) >= 2:
+            distances, travel_times, speeds = metrics.trip_metrics(self.times, self.lats, self.lons, self.distance_method)
         else:
-            avg_speed = total_distance / (total_time.total_seconds()/3600)
-        
+            distances, travel_times, speeds = np.empty(0), np.empty(0), np.empty(0)
+        total_distance, total_time, avg_speed = metrics.route_totals(distances, travel_times)
+
+        self.trip_distances = distances
+        self.trip_times = travel_times
+        self.trip_speeds = speeds
         self.total_distance = total_distance
-        self.total_time = total_time 
+        self.total_time = timedelta(seconds=total_time)
         self.avg_speed = avg_speed
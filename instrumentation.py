@@ -0,0 +1,166 @@
+import json
+import time
+import platform
+import inspect
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+class Report:
+    """
+    The stages recorded during one run, in the order they finished.
+    Every record holds the stage name, its parent stage, wall time, self time (the wall time outside the nested stages), peak memory and counts.
+    """
+    def __init__(self, memory:bool=True):
+        """
+        Parameters:
+        memory: Whether the peak memory of the stages is traced. Tracing memory slows the stages down noticeably.
+        """
+        self.memory = memory
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.records = []
+        self.stack = [] # The open stages, each [name, start time, memory at the start, peak memory so far, wall time of the nested stages].
+
+    def totals(self) -> dict:
+        """
+        The records aggregated by stage name: {name: {'calls', 'wall', 'self', 'peak', counts...}}.
+        Wall and self times and counts are summed, peaks are the maximum.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'calls': 0, 'wall': 0.0, 'self': 0.0, 'peak': None})
+            total['calls'] += 1
+            total['wall'] += record['wall']
+            total['self'] += record['self']
+            if record['peak'] is not None:
+                total['peak'] = max(total['peak'] or 0, record['peak'])
+            for (name, value) in record['counts'].items():
+                total[name] = total.get(name, 0) + value
+        return totals
+
+    def to_dict(self) -> dict:
+        return {'started': self.started, 'python': platform.python_version(), 'memory': self.memory,
+                'stages': self.records, 'totals': self.totals()}
+
+    def save(self, path:str):
+        """
+        Write the report as JSON.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+    def summary(self) -> str:
+        """
+        A table of the totals, one line per stage, in seconds and MiB.
+        The self time of a stage leaves out its nested stages, e.g. the grouping done by routes_organise around build_route and trip_metrics.
+        """
+        lines = [f'{"stage":<45}{"calls":>7}{"wall (s)":>12}{"self (s)":>12}{"peak (MiB)":>12}  counts']
+        for (name, total) in self.totals().items():
+            peak = f'{total["peak"] / 2**20:.1f}' if total['peak'] is not None else '-'
+            counts = ', '.join(f'{key}={value}' for (key, value) in total.items() if key not in ('calls', 'wall', 'self', 'peak'))
+            lines.append(f'{name:<45}{total["calls"]:>7}{total["wall"]:>12.4f}{total["self"]:>12.4f}{peak:>12}  {counts}')
+        return '\n'.join(lines)
+
+# The report of the current run, or None while instrumentation is off.
+current = None
+
+def enable(memory:bool=True) -> Report:
+    """
+    Start recording the stages into a new report.
+
+    Arguments:
+    memory: Whether the peak memory of the stages is traced with tracemalloc.
+    """
+    global current
+    current = Report(memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return current
+
+def disable() -> Report:
+    """
+    Stop recording and return the report of the run.
+    """
+    global current
+    report, current = current, None
+    if report is not None and report.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return report
+
+@contextmanager
+def profiled(path:str=None, memory:bool=True):
+    """
+    Record the stages run inside a with block, and save the report to path if given.
+
+    Example:
+    with instrumentation.profiled('Reports/batch3.json') as report:
+        dataset.routes_organise(['Name', 'date'])
+    print(report.summary())
+    """
+    report = enable(memory)
+    try:
+        yield report
+    finally:
+        disable()
+        if path is not None:
+            report.save(path)
+
+def stage(name:str=None, counts=None):
+    """
+    Decorator recording every call of a function as a stage of the current report.
+    While instrumentation is off the wrapper only checks one global before calling the function.
+    Calls made in worker processes are not recorded, they are part of the stage that started the workers.
+
+    Arguments:
+    name: The name of the stage. Defaults to the module and qualified name of the function.
+    counts: A function (result, **arguments) -> {name: number} giving the rows or objects handled by a call,
+        called with the arguments of the call by parameter name.
+    """
+    def decorator(function):
+        stage_name = name or f'{function.__module__}.{function.__qualname__}'
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            report = current
+            if report is None:
+                return function(*args, **kwargs)
+            if report.memory:
+                memory, peak = tracemalloc.get_traced_memory()
+                if report.stack:
+                    report.stack[-1][3] = max(report.stack[-1][3], peak)
+                tracemalloc.reset_peak()
+            else:
+                memory = None
+            report.stack.append([stage_name, time.perf_counter(), memory, memory, 0.0])
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                (_, start, memory, peak, nested) = report.stack.pop()
+                wall = time.perf_counter() - start
+                if report.stack:
+                    report.stack[-1][4] += wall
+                if report.memory:
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                    # The parent's peak includes the peak of this stage.
+                    if report.stack:
+                        report.stack[-1][3] = max(report.stack[-1][3], peak)
+                    peak -= memory
+            if counts is not None:
+                arguments = signature.bind(*args, **kwargs)
+                arguments.apply_defaults()
+                counted = counts(result, **arguments.arguments)
+            else:
+                counted = {}
+            report.records.append({
+                'stage': stage_name,
+                'parent': report.stack[-1][0] if report.stack else None,
+                'wall': wall,
+                'self': wall - nested,
+                'peak': peak,
+                'counts': counted,
+            })
+            return result
+        return wrapper
+    return decorator
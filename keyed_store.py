@@ -0,0 +1,146 @@
+import bisect
+from datetime import date, datetime, timedelta
+import pandas as pd
+
+def as_date(value) -> date:
+    """
+    Convert a date given as a date, datetime, Timestamp or ISO string to a date.
+    """
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return value.date()
+    return value
+
+class KeyedStore:
+    """
+    Routes or stops keyed by their group keys, usually (vehicle, date).
+    Lookups by key are dictionary lookups, and the dates of every vehicle are kept sorted,
+    so that the groups of some vehicles or of a date range are found without scanning all the keys.
+    It behaves like a dictionary {key: value} otherwise.
+    """
+    def __init__(self, items=None, prefix:str=''):
+        """
+        Parameters:
+        items: A dictionary or an iterable of (key, value) to start with.
+        prefix: The prefix of the display names of the groups, e.g. 'GPS-' or 'POD-'.
+        """
+        self.prefix = prefix
+        self.data = {}
+        self.index = None # {vehicle: sorted list of dates}, built on the first query.
+        self.names = None # {display name: key}, built on the first lookup by name.
+        for (key, value) in (items.items() if isinstance(items, dict) else items or []):
+            self[key] = value
+
+    def name(self, key:tuple) -> str:
+        """
+        The display name of a group, e.g. 'POD-W904-2023-08-10', as used for the map layers.
+        """
+        return self.prefix + '-'.join(map(str, key))
+
+    def key_of(self, key) -> tuple:
+        """
+        Normalise a key: the date of a (vehicle, date) key may be given as a string, datetime or Timestamp,
+        and a display name made by name is accepted for compatibility with the former string keys.
+        """
+        if isinstance(key, str):
+            if self.names is None:
+                self.names = {self.name(stored): stored for stored in self.data}
+            return self.names.get(key, key)
+        if not isinstance(key, tuple):
+            return (key,)
+        if len(key) == 2:
+            return (key[0], as_date(key[1]))
+        return key
+
+    def __setitem__(self, key, value):
+        key = key if isinstance(key, tuple) else (key,)
+        if key not in self.data:
+            self.index = None
+            self.names = None
+        self.data[key] = value
+
+    def __getitem__(self, key):
+        return self.data[self.key_of(key)]
+
+    def get(self, key, default=None):
+        return self.data.get(self.key_of(key), default)
+
+    def __contains__(self, key) -> bool:
+        return self.key_of(key) in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
+
+    def build_index(self):
+        self.index = {}
+        for key in self.data:
+            self.index.setdefault(key[0], []).append(key[1:])
+        for keys in self.index.values():
+            keys.sort()
+
+    def vehicles(self) -> list:
+        """
+        The distinct vehicles, sorted.
+        """
+        if self.index is None:
+            self.build_index()
+        return sorted(self.index)
+
+    def dates(self, vehicle) -> list:
+        """
+        The sorted dates of a vehicle.
+        """
+        if self.index is None:
+            self.build_index()
+        return [rest[0] for rest in self.index.get(vehicle, [])]
+
+    def range(self, vehicles:list=None, start=None, end=None) -> list:
+        """
+        The keys of the given vehicles between two dates, in vehicle and date order.
+
+        Arguments:
+        vehicles: The vehicles. All of them if None.
+        start, end: The first and last dates included. Unbounded if None.
+
+        Returns:
+        A list of keys.
+        """
+        if self.index is None:
+            self.build_index()
+        start = as_date(start) if start is not None else None
+        end = as_date(end) if end is not None else None
+        keys = []
+        for vehicle in (self.vehicles() if vehicles is None else vehicles):
+            rests = self.index.get(vehicle, [])
+            low = bisect.bisect_left(rests, (start,)) if start is not None else 0
+            # The keys on the end date are included by searching for the day after.
+            high = bisect.bisect_left(rests, (end + timedelta(days=1),)) if end is not None else len(rests)
+            keys.extend((vehicle,) + rest for rest in rests[low:high])
+        return keys
+
+    def select(self, vehicles:list=None, start=None, end=None, dates=None) -> 'KeyedStore':
+        """
+        The groups of some vehicles and dates, as a new store sharing the values.
+
+        Arguments:
+        vehicles, start, end: See range.
+        dates: If given, only the groups on one of these dates are kept.
+        """
+        keys = self.range(vehicles, start, end)
+        if dates is not None:
+            dates = {as_date(value) for value in dates}
+            keys = [key for key in keys if key[1] in dates]
+        return KeyedStore(((key, self.data[key]) for key in keys), self.prefix)
@@ -0,0 +1,180 @@
+import numpy as np
+from instrumentation import stage
+
+EARTH_RADIUS = 6371.0088 # Mean earth radius in km, used by the haversine mode.
+
+# WGS-84 ellipsoid, the same one geopy's geodesic uses by default.
+WGS84_A = 6378.137 # Semi-major axis in km.
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+# The ellipsoidal mode agrees with geopy.distance.geodesic within this many km for non-antipodal points.
+ELLIPSOIDAL_TOLERANCE = 1e-6
+
+def haversine(lats1:np.ndarray, lons1:np.ndarray, lats2:np.ndarray, lons2:np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances on a spherical earth.
+
+    Arguments:
+    lats1, lons1, lats2, lons2: Coordinates of the start and end points in degrees.
+
+    Returns:
+    The distances in km.
+    """
+    phi1, phi2 = np.radians(lats1), np.radians(lats2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons2) - np.radians(lons1)
+    h = np.sin(dphi/2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda/2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+def ellipsoidal(lats1:np.ndarray, lons1:np.ndarray, lats2:np.ndarray, lons2:np.ndarray, max_iter:int=200) -> np.ndarray:
+    """
+    Distances on the WGS-84 ellipsoid, solving Vincenty's inverse problem for all the pairs at once.
+    Pairs which have converged are frozen while the others keep iterating. Pairs with a missing coordinate give NaN.
+
+    Arguments:
+    lats1, lons1, lats2, lons2: Coordinates of the start and end points in degrees.
+    max_iter: The maximum number of iterations.
+
+    Returns:
+    The distances in km.
+    """
+    lats1, lons1, lats2, lons2 = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (lats1, lons1, lats2, lons2)))
+    L = np.radians(lons2 - lons1)
+    U1 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lats1)))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(np.radians(lats2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    sin_sigma = np.zeros_like(L)
+    cos_sigma = np.ones_like(L)
+    sigma = np.zeros_like(L)
+    cos_sq_alpha = np.ones_like(L)
+    cos_2sigma_m = np.zeros_like(L)
+    finite = np.isfinite(L) & np.isfinite(lats1) & np.isfinite(lats2)
+    active = finite.copy()
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        s_sigma = np.sqrt((cosU2 * sin_lam)**2 + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)**2)
+        c_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sig = np.arctan2(s_sigma, c_sigma)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sin_alpha = np.where(s_sigma == 0, 0, cosU1 * cosU2 * sin_lam / s_sigma)
+            c_sq_alpha = 1 - sin_alpha**2
+            c_2sigma_m = np.where(c_sq_alpha == 0, 0, c_sigma - 2 * sinU1 * sinU2 / c_sq_alpha) # Equatorial lines.
+        C = WGS84_F / 16 * c_sq_alpha * (4 + WGS84_F * (4 - 3 * c_sq_alpha))
+        lam_new = L + (1 - C) * WGS84_F * sin_alpha * (sig + C * s_sigma * (c_2sigma_m + C * c_sigma * (-1 + 2 * c_2sigma_m**2)))
+
+        sin_sigma = np.where(active, s_sigma, sin_sigma)
+        cos_sigma = np.where(active, c_sigma, cos_sigma)
+        sigma = np.where(active, sig, sigma)
+        cos_sq_alpha = np.where(active, c_sq_alpha, cos_sq_alpha)
+        cos_2sigma_m = np.where(active, c_2sigma_m, cos_2sigma_m)
+        converged = np.abs(lam_new - lam) <= 1e-12
+        lam = np.where(active, lam_new, lam)
+        active &= ~converged
+
+    u_sq = cos_sq_alpha * (WGS84_A**2 - WGS84_B**2) / WGS84_B**2
+    A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (cos_sigma * (-1 + 2 * cos_2sigma_m**2) -
+                  B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sigma_m**2)))
+    return np.where(finite, WGS84_B * A * (sigma - delta_sigma), np.nan)
+
+DISTANCE_METHODS = {'haversine': haversine, 'ellipsoidal': ellipsoidal}
+
+def reference_cos(lats:np.ndarray) -> float:
+    """
+    The cosine of the mean latitude of points, the scale of the longitudes in project. 1 if there are no points.
+    """
+    return float(np.cos(np.radians(np.mean(lats)))) if len(lats) else 1.0
+
+def project(lats:np.ndarray, lons:np.ndarray, cos_lat:float=None) -> tuple:
+    """
+    Equirectangular projection to meters, accurate enough at the scale of a city.
+
+    Arguments:
+    lats, lons: Coordinates in degrees.
+    cos_lat: The cosine of the reference latitude, see reference_cos. The mean latitude of the points if None.
+        Points projected with the same cos_lat can be compared, e.g. the points of an index and its queries.
+
+    Returns:
+    The x and y coordinates in meters.
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    if cos_lat is None:
+        cos_lat = reference_cos(lats)
+    radius = EARTH_RADIUS * 1000
+    return np.radians(lons) * cos_lat * radius, np.radians(lats) * radius
+
+@stage(counts=lambda result, times, **_: {'trips': max(len(times) - 1, 0)})
+def trip_metrics(times:np.ndarray, lats:np.ndarray, lons:np.ndarray, method:str='ellipsoidal') -> tuple:
+    """
+    Calculate the distance, travel time and speed of every trip between consecutive points in one pass.
+
+    Arguments:
+    times: datetime64 array of arrival times, sorted.
+    lats, lons: Coordinates of the points in degrees.
+    method: 'ellipsoidal' (matches geodesic) or 'haversine' (faster, spherical).
+
+    Returns:
+    The distances in km, travel times in seconds and speeds in km/h of the trips, each as an array of length len(times) - 1.
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Unknown distance method '{method}', expected one of {list(DISTANCE_METHODS)}.")
+    distances = DISTANCE_METHODS[method](lats[:-1], lons[:-1], lats[1:], lons[1:])
+    travel_times = np.diff(times.astype('datetime64[ns]').astype(np.int64)) / 1e9
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speeds = np.where(travel_times == 0, 0, distances / (travel_times / 3600))
+    return distances, travel_times, speeds
+
+def route_totals(distances:np.ndarray, travel_times:np.ndarray) -> tuple:
+    """
+    Sum the trip metrics of a route.
+
+    Arguments:
+    distances, travel_times: The outputs of trip_metrics for one route.
+
+    Returns:
+    The total distance in km, total time in seconds and average speed in km/h.
+    """
+    total_distance = float(distances.sum())
+    total_time = float(travel_times.sum())
+    avg_speed = 0 if total_time == 0 else total_distance / (total_time / 3600)
+    return total_distance, total_time, avg_speed
+
+def dataset_metrics(routes:dict, method:str='ellipsoidal') -> tuple:
+    """
+    Calculate the trip metrics of all the routes in a dataset at once.
+    The points of all the routes are concatenated, so the distance calculation runs as a single vectorised call,
+    and the trips bridging two routes are dropped afterwards.
+
+    Arguments:
+    routes: A dictionary of columnar routes.
+    method: 'ellipsoidal' or 'haversine'.
+
+    Returns:
+    A dictionary of (distances, travel_times, speeds) per route name, and a dictionary of (total_distance, total_time, avg_speed) per route name.
+    """
+    names = list(routes)
+    if not names:
+        return {}, {}
+    lengths = np.array([len(routes[name].times) for name in names])
+    times = np.concatenate([routes[name].times for name in names])
+    lats = np.concatenate([routes[name].lats for name in names])
+    lons = np.concatenate([routes[name].lons for name in names])
+    distances, travel_times, speeds = trip_metrics(times, lats, lons, method)
+
+    trips = {}
+    totals = {}
+    start = 0
+    for name, length in zip(names, lengths):
+        stop = start + max(length - 1, 0)
+        trips[name] = (distances[start:stop], travel_times[start:stop], speeds[start:stop])
+        totals[name] = route_totals(distances[start:stop], travel_times[start:stop])
+        start += length
+    return trips, totals
@@ -0,0 +1,346 @@
+from __future__ import annotations
+import os
+import heapq
+import argparse
+import numpy as np
+from typing import TYPE_CHECKING
+
+# scipy and the road network libraries are only imported when an oracle is built or snaps coordinates.
+if TYPE_CHECKING:
+    import networkx as nx
+    from graph_store import NodeIndex
+
+SPEED_DRIVING = 30 # In km/h, used for the travel times when the oracle is weighted by length.
+ACTIVE_LANDMARKS = 4 # The number of landmarks bounding the distances during one search.
+MATRIX_BLOCK = 64 # The number of sources searched at once by matrix.
+MIN_WEIGHT = 1e-6 # Zero weights would be dropped by the sparse matrix, so they are raised to this.
+
+class DistanceOracle:
+    """
+    Shortest distances and paths over a fixed regional road graph, precomputed once and saved to disk.
+    The graph is kept as a compressed sparse row adjacency, restricted to its largest strongly connected component,
+    together with the distances from and to a few landmark nodes spread over the region.
+    Single paths are searched with A* guided by the landmark lower bounds (ALT), which only settles the nodes
+    near the path instead of a full Dijkstra disc around the start, and distance matrices run one Dijkstra per source in scipy.
+    """
+    def __init__(self, nodes:np.ndarray, lats:np.ndarray, lons:np.ndarray, indptr:np.ndarray, indices:np.ndarray, weights:np.ndarray,
+                 landmarks:np.ndarray, from_landmarks:np.ndarray, to_landmarks:np.ndarray, weight:str='length'):
+        """
+        Parameters:
+        nodes: The node ids of the graph, by position.
+        lats, lons: The coordinates of the nodes.
+        indptr, indices, weights: The outgoing edges of the nodes in CSR form, with the positions of their end nodes.
+        landmarks: The positions of the landmark nodes.
+        from_landmarks, to_landmarks: Arrays (landmarks, nodes) of the distances from every landmark to every node and back.
+        weight: The edge attribute the distances are made of, 'length' (meters) or 'travel_time' (seconds).
+        """
+        self.nodes = nodes
+        self.lats = lats
+        self.lons = lons
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.landmarks = landmarks
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+        self.weight = weight
+        self.positions = {node: position for (position, node) in enumerate(nodes.tolist())}
+        self._lists = None # The graph and landmark tables as Python lists, built by the first search, see search_lists.
+        self._index = None
+
+    @classmethod
+    def from_graph(cls, G:nx.MultiDiGraph, weight:str='length', landmarks:int=16) -> 'DistanceOracle':
+        """
+        Preprocess a road graph.
+
+        Arguments:
+        G: A graph whose nodes carry 'x' and 'y' and whose edges carry the weight attribute.
+        weight: The edge attribute to minimise.
+        landmarks: The number of landmarks. More landmarks give tighter bounds and faster queries, at the cost of memory.
+
+        Returns:
+        The oracle.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        nodes = np.array(list(G.nodes))
+        positions = {node: position for (position, node) in enumerate(nodes.tolist())}
+        edges = [(positions[u], positions[v], data.get(weight, np.inf)) for (u, v, data) in G.edges(data=True) if u != v]
+        heads = np.array([edge[0] for edge in edges], dtype=np.int64)
+        tails = np.array([edge[1] for edge in edges], dtype=np.int64)
+        lengths = np.array([edge[2] for edge in edges], dtype=float)
+        graph = csr_matrix((np.ones(len(heads)), (heads, tails)), shape=(len(nodes), len(nodes)))
+
+        # Paths cannot leave the largest strongly connected component, so nodes outside it would have no distances.
+        _, labels = connected_components(graph, directed=True, connection='strong')
+        kept = np.nonzero(labels == np.bincount(labels).argmax())[0]
+        new_positions = np.full(len(nodes), -1)
+        new_positions[kept] = np.arange(len(kept))
+        inside = (new_positions[heads] >= 0) & (new_positions[tails] >= 0) & np.isfinite(lengths)
+        heads, tails, lengths = new_positions[heads[inside]], new_positions[tails[inside]], np.maximum(lengths[inside], MIN_WEIGHT)
+
+        # Keep the shortest of parallel edges, as the sparse matrix would add them up.
+        order = np.lexsort((lengths, tails, heads))
+        heads, tails, lengths = heads[order], tails[order], lengths[order]
+        first = np.ones(len(heads), dtype=bool)
+        first[1:] = (heads[1:] != heads[:-1]) | (tails[1:] != tails[:-1])
+        graph = csr_matrix((lengths[first], (heads[first], tails[first])), shape=(len(kept), len(kept)))
+        graph.sort_indices()
+
+        nodes = nodes[kept]
+        lats = np.array([G.nodes[node]['y'] for node in nodes.tolist()], dtype=float)
+        lons = np.array([G.nodes[node]['x'] for node in nodes.tolist()], dtype=float)
+        chosen, from_landmarks, to_landmarks = cls.select_landmarks(graph, landmarks)
+        return cls(nodes, lats, lons, graph.indptr.astype(np.int64), graph.indices.astype(np.int64), graph.data,
+                   chosen, from_landmarks, to_landmarks, weight)
+
+    @staticmethod
+    def select_landmarks(graph, count:int) -> tuple:
+        """
+        Choose landmarks far from each other: every new landmark is the node farthest from the landmarks chosen so far.
+        Landmarks on the edge of the region give the tightest bounds for most queries.
+
+        Arguments:
+        graph: The CSR adjacency matrix of a strongly connected graph.
+        count: The number of landmarks.
+
+        Returns:
+        The positions of the landmarks, and the arrays (landmarks, nodes) of the distances from and to them.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        reverse = graph.T.tocsr()
+        chosen, from_landmarks, to_landmarks = [], [], []
+        # The first landmark is the farthest node from an arbitrary one.
+        closest = dijkstra(graph, indices=0)
+        for _ in range(min(count, graph.shape[0])):
+            chosen.append(int(np.argmax(closest)))
+            from_landmarks.append(dijkstra(graph, indices=chosen[-1]))
+            to_landmarks.append(dijkstra(reverse, indices=chosen[-1]))
+            round_trips = from_landmarks[-1] + to_landmarks[-1]
+            closest = round_trips if len(chosen) == 1 else np.minimum(closest, round_trips)
+        shape = (len(chosen), graph.shape[0])
+        return (np.array(chosen, dtype=np.int64), np.array(from_landmarks).reshape(shape), np.array(to_landmarks).reshape(shape))
+
+    @classmethod
+    def build(cls, source:str, path:str, weight:str='length', landmarks:int=16) -> 'DistanceOracle':
+        """
+        Read the road graph of a region once, preprocess it and save the oracle to path.
+
+        Arguments:
+        source: A .graphml file, an .osm/.xml file exported from OpenStreetMap, or a GraphStore directory.
+        path: The .npz file to save the oracle into.
+        weight, landmarks: See from_graph.
+
+        Returns:
+        The built oracle.
+        """
+        import networkx as nx
+        import osmnx as ox
+        from graph_store import GraphStore, merge_graph
+
+        if os.path.isdir(source):
+            store = GraphStore(source)
+            G = nx.MultiDiGraph(**store.graph_attrs)
+            for tile in store.tiles:
+                merge_graph(G, store.load_tile(tile))
+        elif source.endswith('.graphml'):
+            G = ox.load_graphml(source)
+        else:
+            G = ox.graph_from_xml(source, simplify=False, retain_all=True)
+        if weight == 'travel_time' and not all('travel_time' in data for (_, _, data) in G.edges(data=True)):
+            G = ox.add_edge_travel_times(ox.add_edge_speeds(G))
+        oracle = cls.from_graph(G, weight, landmarks)
+        oracle.save(path)
+        return oracle
+
+    def save(self, path:str):
+        np.savez(path, nodes=self.nodes, lats=self.lats, lons=self.lons, indptr=self.indptr, indices=self.indices, weights=self.weights,
+                 landmarks=self.landmarks, from_landmarks=self.from_landmarks, to_landmarks=self.to_landmarks, weight=np.array(self.weight))
+
+    @classmethod
+    def load(cls, path:str) -> 'DistanceOracle':
+        """
+        Read an oracle saved by build or save.
+        """
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays['weight'] = str(arrays['weight'])
+        return cls(**arrays)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def snap(self, lats:np.ndarray, lons:np.ndarray) -> np.ndarray:
+        """
+        The positions of the nearest nodes of coordinates, in degrees.
+        """
+        if self._index is None:
+            from graph_store import NodeIndex
+            self._index = NodeIndex.from_coordinates(np.arange(len(self.nodes)), self.lats, self.lons)
+        positions, _ = self._index.nearest(lats, lons)
+        return positions
+
+    def search_lists(self) -> tuple:
+        """
+        The CSR arrays and the landmark distances of every node as Python lists.
+        A* looks at the graph one node at a time, which is much faster on lists than on NumPy arrays,
+        but the lists take several times the memory of the arrays, so they are only built when paths are searched.
+        """
+        if self._lists is None:
+            self._lists = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist(),
+                           self.from_landmarks.T.tolist(), self.to_landmarks.T.tolist())
+        return self._lists
+
+    def active_landmarks(self, source:int, target:int, count:int=ACTIVE_LANDMARKS) -> list:
+        """
+        The landmarks giving the best lower bounds between two nodes. A* only uses these, so that every node it reaches costs a few subtractions.
+        """
+        bounds = np.maximum(self.from_landmarks[:, target] - self.from_landmarks[:, source], self.to_landmarks[:, source] - self.to_landmarks[:, target])
+        return np.argsort(bounds)[::-1][:count].tolist()
+
+    def search(self, source:int, target:int) -> tuple:
+        """
+        A* from a node to another, both given by position.
+
+        Returns:
+        The distance, and the positions of the nodes on the path. (inf, None) if there is no path.
+        """
+        if source == target:
+            return 0.0, [source]
+        indptr, indices, weights, from_landmarks, to_landmarks = self.search_lists()
+        active = self.active_landmarks(source, target)
+        from_target = [from_landmarks[target][landmark] for landmark in active]
+        to_target = [to_landmarks[target][landmark] for landmark in active]
+
+        def lower_bound(position):
+            # The triangle inequality over the landmarks: d(L, t) - d(L, v) <= d(v, t) and d(v, L) - d(t, L) <= d(v, t).
+            from_position, to_position = from_landmarks[position], to_landmarks[position]
+            bound = 0.0
+            for (landmark, from_t, to_t) in zip(active, from_target, to_target):
+                bound = max(bound, from_t - from_position[landmark], to_position[landmark] - to_t)
+            return bound
+
+        distances = {source: 0.0}
+        parents = {source: None}
+        bounds = {}
+        settled = set()
+        queue = [(lower_bound(source), source)]
+        while queue:
+            (_, position) = heapq.heappop(queue)
+            if position in settled:
+                continue
+            if position == target:
+                path = [target]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                return distances[target], path[::-1]
+            settled.add(position)
+            distance = distances[position]
+            for edge in range(indptr[position], indptr[position + 1]):
+                neighbour = indices[edge]
+                candidate = distance + weights[edge]
+                if candidate < distances.get(neighbour, np.inf):
+                    distances[neighbour] = candidate
+                    parents[neighbour] = position
+                    if neighbour not in bounds:
+                        bounds[neighbour] = lower_bound(neighbour)
+                    heapq.heappush(queue, (candidate + bounds[neighbour], neighbour))
+        return np.inf, None
+
+    def distance(self, u, v) -> float:
+        """
+        The shortest distance between two nodes, given by node id.
+        """
+        return self.search(self.positions[u], self.positions[v])[0]
+
+    def path(self, u, v) -> list:
+        """
+        The shortest path between two nodes, given by node id, as a list of node ids. None if there is no path.
+        """
+        _, path = self.search(self.positions[u], self.positions[v])
+        return self.nodes[path].tolist() if path is not None else None
+
+    def route(self, start:list, end:list) -> list:
+        """
+        The shortest path between two locations [lat, lon], each snapped to its nearest node, as a list of node ids.
+        """
+        positions = self.snap([start[0], end[0]], [start[1], end[1]])
+        _, path = self.search(int(positions[0]), int(positions[1]))
+        return self.nodes[path].tolist() if path is not None else None
+
+    def matrix(self, lats:np.ndarray, lons:np.ndarray, to_lats:np.ndarray=None, to_lons:np.ndarray=None) -> np.ndarray:
+        """
+        The shortest distances between many locations at once, each snapped to its nearest node.
+
+        Arguments:
+        lats, lons: The origins, in degrees.
+        to_lats, to_lons: The destinations. The origins if None.
+
+        Returns:
+        An array (origins, destinations) in the unit of the weight.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        sources = self.snap(lats, lons)
+        targets = sources if to_lats is None else self.snap(to_lats, to_lons)
+        unique_sources, inverse = np.unique(sources, return_inverse=True)
+        graph = csr_matrix((self.weights, self.indices, self.indptr), shape=(len(self.nodes), len(self.nodes)))
+        # Going through the best landmark bounds every distance from above, so the search stops once it is past the farthest target
+        # instead of covering the whole region. The bounds are reduced one landmark at a time to keep them (sources, targets) in size.
+        bounds = np.full((len(unique_sources), len(targets)), np.inf)
+        for landmark in range(len(self.landmarks)):
+            np.minimum(bounds, self.to_landmarks[landmark, unique_sources][:, None] + self.from_landmarks[landmark, targets][None, :], out=bounds)
+        # Dijkstra gives the distances to every node, so the sources are searched in blocks to keep that array small.
+        distances = np.empty((len(unique_sources), len(targets)))
+        for start in range(0, len(unique_sources), MATRIX_BLOCK):
+            block = slice(start, start + MATRIX_BLOCK)
+            limit = bounds[block].max(initial=0) * (1 + 1e-9)
+            distances[block] = dijkstra(graph, indices=unique_sources[block], limit=limit)[:, targets]
+        return distances[inverse]
+
+    def travel_times(self, stops:list, speed:float=SPEED_DRIVING) -> np.ndarray:
+        """
+        The travel times between every pair of stops, in seconds.
+
+        Arguments:
+        stops: A list of Stop, or of [lat, lon].
+        speed: The driving speed in km/h, used when the oracle is weighted by length.
+
+        Returns:
+        An array (stops, stops).
+        """
+        locs = np.array([getattr(stop, 'loc', stop) for stop in stops], dtype=float).reshape(-1, 2)
+        distances = self.matrix(locs[:, 0], locs[:, 1])
+        return distances if self.weight == 'travel_time' else distances / (speed / 3.6)
+
+    def graph(self, nodes:list) -> nx.MultiDiGraph:
+        """
+        A graph made of some nodes of the oracle and the edges between them, with their coordinates,
+        so that the paths found by the oracle can be drawn like the ones found on a downloaded graph.
+        """
+        import networkx as nx
+
+        G = nx.MultiDiGraph(crs='epsg:4326')
+        positions = [self.positions[node] for node in nodes]
+        for position in positions:
+            G.add_node(self.nodes[position].item(), y=self.lats[position].item(), x=self.lons[position].item())
+        kept = set(positions)
+        for position in positions:
+            for edge in range(self.indptr[position], self.indptr[position + 1]):
+                neighbour = self.indices[edge].item()
+                if neighbour in kept:
+                    G.add_edge(self.nodes[position].item(), self.nodes[neighbour].item(), key=0, **{self.weight: self.weights[edge].item()})
+        return G
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Preprocess the road graph of a region into a distance oracle.')
+    parser.add_argument('source', help='A .graphml or .osm file, or a GraphStore directory.')
+    parser.add_argument('output', help='The .npz file to write.')
+    parser.add_argument('--weight', default='length', choices=['length', 'travel_time'])
+    parser.add_argument('--landmarks', type=int, default=16)
+    args = parser.parse_args()
+    oracle = DistanceOracle.build(args.source, args.output, args.weight, args.landmarks)
+    print(f'{len(oracle)} nodes, {len(oracle.indices)} edges, {len(oracle.landmarks)} landmarks saved to {args.output}')
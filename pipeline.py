@@ -0,0 +1,240 @@
+import os
+import json
+import pickle
+import hashlib
+import argparse
+import cluster
+import tools
+import trilateration
+import instrumentation
+from cache import CACHE_VERSION
+from incremental import STATE_VERSION
+from process import GroupedDataset
+
+STAGES = ['ingest', 'organise', 'match', 'estimate', 'render']
+
+# Batches whose files do not follow the Datasets/Batch{n}/POD{n}.csv and GPS{n}.csv naming.
+BATCH_FILES = {
+    '1': ('Datasets/Batch1/POD1.csv', 'Datasets/Batch1/GPS1_W904.csv'),
+}
+
+def batch_files(batch:str, data_dir:str='Datasets') -> tuple:
+    """
+    The stops and routes CSV files of a batch. A CSV file is converted from the Excel file of the same name when it is missing or older.
+
+    Arguments:
+    batch: The number of the batch, e.g. '3'.
+    data_dir: The directory containing the Batch{n} directories.
+
+    Returns:
+    The locations of the stops and routes CSV files.
+    """
+    if batch in BATCH_FILES and data_dir == 'Datasets':
+        files = BATCH_FILES[batch]
+    else:
+        files = (os.path.join(data_dir, f'Batch{batch}', f'POD{batch}.csv'), os.path.join(data_dir, f'Batch{batch}', f'GPS{batch}.csv'))
+    for csv_file in files:
+        excel_file = os.path.splitext(csv_file)[0] + '.xlsx'
+        if os.path.exists(excel_file):
+            tools.xlsx_to_csv(excel_file_path=excel_file, csv_file_path=csv_file)
+    return files
+
+class Pipeline:
+    """
+    The ingest, organise, match, estimate and render stages of one batch.
+    Every stage reuses the output of the previous runs while its inputs and parameters have not changed:
+    ingest through the normalised dataset cache, organise through the partition store,
+    and the later stages through pickled outputs keyed by a digest of their inputs and parameters.
+    """
+    def __init__(self, name:str, stops_csv:str, routes_csv:str, work_dir:str, vehicles:list=None, time_shift:int=2,
+                 workers:int=None, force:bool=False, time_zones:tuple=None):
+        """
+        Parameters:
+        name: The name of the batch, used in the names of the outputs.
+        stops_csv, routes_csv: The location of the datasets.
+        work_dir: The directory where the outputs of the stages are kept.
+        vehicles: The names of the vehicles matched and estimated. All the vehicles of the stops dataset if None.
+        time_shift: The number of hours added to the stop times to align them with the GPS times.
+        workers: The number of worker processes of organise and estimate.
+        force: Compute the match, estimate and render stages again even if their outputs are up to date.
+        time_zones: The timezones of the stop and GPS clocks, e.g. ('UTC', 'Europe/Stockholm'). If given, the stop times are converted
+            between them before time_shift is added, which keeps the alignment right across daylight saving changes, see GroupedDataset.align_times.
+        """
+        self.name = name
+        self.stops_csv = stops_csv
+        self.routes_csv = routes_csv
+        self.work_dir = work_dir
+        self.vehicles = vehicles
+        self.time_shift = time_shift
+        self.workers = workers
+        self.force = force
+        self.time_zones = time_zones
+        self.dataset = None
+        self.organised = False
+        self.outputs = {}
+
+    def key(self, stage:str) -> str:
+        """
+        The digest of everything the output of a stage depends on: the content of the source files and the parameters of the stage and the stages before it.
+        """
+        dataset = self.ingest()
+        parameters = {'sources': [dataset.cache.digest(self.stops_csv), dataset.cache.digest(self.routes_csv)], 'version': [CACHE_VERSION, STATE_VERSION]}
+        if STAGES.index(stage) >= STAGES.index('match'):
+            parameters.update(vehicles=sorted(self.vehicles) if self.vehicles is not None else None, time_shift=self.time_shift,
+                              time_zones=list(self.time_zones) if self.time_zones is not None else None)
+        if stage == 'estimate':
+            parameters.update(speed_walking=trilateration.SPEED_WALKING)
+        return hashlib.sha1(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+    def cached(self, stage:str, compute, valid=None):
+        """
+        The output of a stage, loaded from work_dir if it was saved with the same key, otherwise computed by compute() and saved.
+
+        Arguments:
+        stage: The name of the stage.
+        compute: A function computing the output.
+        valid: A function telling whether a saved output can still be used, e.g. whether the files it lists still exist.
+        """
+        if stage in self.outputs:
+            return self.outputs[stage]
+        path = os.path.join(self.work_dir, 'stages', f'{stage}-{self.key(stage)}.pkl')
+        if not self.force and os.path.exists(path):
+            with open(path, 'rb') as f:
+                output = pickle.load(f)
+            if valid is None or valid(output):
+                self.outputs[stage] = output
+                return output
+        output = compute()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        self.outputs[stage] = output
+        return output
+
+    def ingest(self) -> GroupedDataset:
+        """
+        Read and normalise the datasets and align the stop times with the GPS times. The normalised datasets are kept in work_dir/cache.
+        """
+        if self.dataset is None:
+            self.dataset = GroupedDataset(self.stops_csv, self.routes_csv, cache_dir=os.path.join(self.work_dir, 'cache'),
+                                          state_dir=os.path.join(self.work_dir, 'state'))
+            self.dataset.time_normalisation(self.dataset.dataset_routes, 'Tid')
+            self.dataset.time_normalisation(self.dataset.dataset_stops, 'DeliveredAt', self.time_shift, *(self.time_zones or (None, None)))
+        return self.dataset
+
+    def organise(self) -> GroupedDataset:
+        """
+        Build the routes and stops per vehicle and date. Only the partitions which changed since the previous run are built again.
+        """
+        dataset = self.ingest()
+        if not self.organised:
+            dataset.routes_organise(['Name', 'date'], workers=self.workers)
+            dataset.stops_organise(['Ruttnamn', 'date'], workers=self.workers)
+            self.organised = True
+        return dataset
+
+    def match(self) -> tuple:
+        """
+        Match the stops of the selected vehicles to their trips, see cluster.find_nearest_trips.
+
+        Returns:
+        The filtered stops, the filtered routes and the matching table.
+        """
+        def compute():
+            dataset = self.organise()
+            vehicles = self.vehicles if self.vehicles is not None else dataset.stops.vehicles()
+            filtered_stops, stops_dates = cluster.stops_filter(dataset, vehicles)
+            filtered_routes = cluster.routes_filter(dataset, stops_dates, vehicles)
+            table = cluster.find_nearest_trips(filtered_stops, filtered_routes)
+            return filtered_stops, filtered_routes, table
+        return self.cached('match', compute)
+
+    def estimate(self) -> str:
+        """
+        Estimate the parking locations of the matched stops, see trilateration.estimate_parking_locations.
+
+        Returns:
+        The location of the CSV file of the estimates.
+        """
+        def compute():
+            filtered_stops, _, _ = self.match()
+            return trilateration.estimate_parking_locations(filtered_stops, workers=self.workers)
+        parking_locations = self.cached('estimate', compute)
+        path = os.path.join(self.work_dir, f'{self.name}_parking_locations.csv')
+        parking_locations.to_csv(path, index=False)
+        return path
+
+    def render(self) -> list:
+        """
+        Draw the sharded map of all the routes and stops and the map of the stops matched to their nearest trips.
+        The maps are drawn again if any of them was deleted since the previous run.
+
+        Returns:
+        The locations of the written maps.
+        """
+        import folium
+        from folium import LayerControl
+
+        def compute():
+            filtered_stops, _, _ = self.match()
+            dataset = self.organise()
+            maps_dir = os.path.join(self.work_dir, 'maps')
+            tools.sharded_plot(os.path.join(maps_dir, self.name), dataset.routes, dataset.stops)
+            map = folium.Map(location=[59.3293, 18.0686], zoom_start=12)
+            tools.nearest_trip_plot(filtered_stops, map)
+            LayerControl().add_to(map)
+            nearest_points = os.path.join(maps_dir, f'{self.name}_nearest_points.html')
+            map.save(nearest_points)
+            return [os.path.join(maps_dir, self.name, 'index.html'), nearest_points]
+        return self.cached('render', compute, valid=lambda paths: all(os.path.exists(path) for path in paths))
+
+    def run(self, stages:list=STAGES) -> dict:
+        """
+        Run the given stages in pipeline order. The stages they depend on are run or loaded as needed.
+
+        Returns:
+        A dictionary {stage: output}.
+        """
+        outputs = {}
+        for stage in STAGES:
+            if stage in stages:
+                outputs[stage] = getattr(self, stage)()
+        return outputs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the delivery data pipeline on one or more batches.')
+    parser.add_argument('--batches', nargs='+', default=['1'], help='The numbers of the batches, e.g. 1 3.')
+    parser.add_argument('--vehicles', nargs='+', default=None, help='The vehicles to match and estimate. All of them if not given.')
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--stops', default=None, help='The stops CSV file, instead of the one of the batch. Needs a single batch.')
+    parser.add_argument('--routes', default=None, help='The routes CSV file, instead of the one of the batch. Needs a single batch.')
+    parser.add_argument('--data-dir', default='Datasets')
+    parser.add_argument('--work-dir', default='Pipeline', help='The directory where the outputs of the stages are kept.')
+    parser.add_argument('--time-shift', type=int, default=None, help='The hours added to the stop times. 2 by default, 0 with --time-zones.')
+    parser.add_argument('--time-zones', nargs=2, default=None, metavar=('STOPS_TZ', 'GPS_TZ'),
+                        help='Convert the stop times between these timezones, e.g. UTC Europe/Stockholm.')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='Compute the match, estimate and render stages again.')
+    parser.add_argument('--profile', action='store_true', help='Save a timing and memory report of every batch, see instrumentation.')
+    args = parser.parse_args()
+    if (args.stops or args.routes) and len(args.batches) != 1:
+        parser.error('--stops and --routes need a single batch.')
+
+    time_shift = args.time_shift if args.time_shift is not None else (0 if args.time_zones else 2)
+
+    for batch in args.batches:
+        stops_csv, routes_csv = batch_files(batch, args.data_dir)
+        name = f'batch{batch}'
+        pipeline = Pipeline(name, args.stops or stops_csv, args.routes or routes_csv, os.path.join(args.work_dir, name),
+                            args.vehicles, time_shift, args.workers, args.force, args.time_zones)
+        if args.profile:
+            os.makedirs(pipeline.work_dir, exist_ok=True)
+            with instrumentation.profiled(os.path.join(pipeline.work_dir, 'report.json')) as report:
+                outputs = pipeline.run(args.stages)
+            print(report.summary())
+        else:
+            outputs = pipeline.run(args.stages)
+        for (stage, output) in outputs.items():
+            if isinstance(output, (str, list)):
+                print(f'{name} {stage}: {output}')
@@ -1,65 +1,337 @@
+import os
+import pickle
+import warnings
 import pandas as pd
-import folium
+from concurrent.futures import ProcessPoolExecutor
 import tools
 import instances
+from cache import DatasetCache
+from incremental import PartitionStore
+from keyed_store import KeyedStore
+from instrumentation import stage
+
+def read_partition(partition) -> pd:
+    """
+    Returns all the rows of a partition made by GroupedDataset.routes_partition as one dataset.
+
+    Arguments:
+    partition: A list of datasets, or the location of the file they were appended to.
+    """
+    if isinstance(partition, str):
+        frames = []
+        with open(partition, 'rb') as f:
+            while True:
+                try:
+                    frames.append(pickle.load(f))
+                except EOFError:
+                    break
+    else:
+        frames = partition
+    return pd.concat(frames)
+
+@stage(counts=lambda result, **_: {'points': len(result.times)})
+def build_route(name:str, data) -> instances.Route:
+    """
+    Sort the data of one group according to the time and create its route.
+    Defined at module level so that it can run in worker processes.
+
+    Arguments:
+    name: The name of the route.
+    data: The dataset of the group, or a partition to be read by read_partition.
+    """
+    if not isinstance(data, pd.DataFrame):
+        data = read_partition(data)
+    return instances.Route(name, data.sort_values(by='timevalue'))
+
+@stage(counts=lambda result, **_: {'stops': len(result)})
+def build_stops(name:str, data:pd) -> instances.StopList:
+    """
+    Sort the data of one group according to the time and create its stops.
+    Defined at module level so that it can run in worker processes.
+
+    Arguments:
+    name: The name of the group, unused. Kept so that build_route and build_stops are interchangeable.
+    data: The dataset of the group.
+    """
+    # Sorting this helps find the nearest GPS points. The sort is stable, so GroupedDataset.stops_table can tell the position of every stop.
+    stops_sorted = data.sort_values(by='timevalue', kind='stable')
+    return instances.StopList(stops_sorted)
+
+def map_groups(function, *iterables, workers:int=None) -> list:
+    """
+    Apply function to every group, serially or spread over a process pool.
+    The results are returned in the order of the groups in both cases.
+
+    Arguments:
+    function: A module-level function.
+    iterables: The arguments of function, one iterable per parameter.
+    workers: The number of worker processes. The groups are processed in this process if it is None or 1.
+    """
+    if workers is None or workers <= 1:
+        return list(map(function, *iterables))
+    iterables = [list(iterable) for iterable in iterables]
+    chunksize = max(1, len(iterables[0]) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *iterables, chunksize=chunksize))
 
 class GroupedDataset:
-    def __init__(self, dataset_stops_loc:str, dataset_routes_loc:str):
+    def __init__(self, dataset_stops_loc:str, dataset_routes_loc:str, chunksize:int=None, partition_dir:str=None, cache_dir:str=None,
+                 state_dir:str=None, verify:bool=False):
         """
         Arguments:
         dataset_stops_loc, dataset_routes_loc: The location of the dataset to be visualised.
+        chunksize: If given, the routes dataset is not loaded at once but streamed in chunks of this many rows by routes_partition.
+        partition_dir: The directory where routes_partition saves the partitions. They are kept in memory if None.
+        cache_dir: If given, normalised datasets are cached there and loaded instead of the source files while those are unchanged.
+        state_dir: If given, routes and stops are organised incrementally: the results of every (vehicle, date) partition are kept there,
+            and only the partitions whose watermark (row count and latest time) moved since the previous run are built again.
+        verify: Also compare the content digest of the partitions whose watermark has not moved, to detect rows edited in place.
+        """
+        self.cache = DatasetCache(cache_dir) if cache_dir is not None else None
+        self.store = PartitionStore(state_dir) if state_dir is not None else None
+        self.verify = verify
+        self.changed_partitions = {} # {'routes'/'stops': [group_keys1, ...]}, the partitions built by the last incremental organise.
+        self.dataset_stops_loc = dataset_stops_loc
+        self.dataset_routes_loc = dataset_routes_loc
+        self.chunksize = chunksize
+        self.partition_dir = partition_dir
+        self.partition_cols = None
+        self.route_partitions = None # {group_keys: [DataFrame1, DataFrame2, ...] or file path}, filled by routes_partition.
+        self.dataset_routes = self.read_dataset(dataset_routes_loc) if chunksize is None else None
+        self.dataset_stops = self.read_dataset(dataset_stops_loc)
+        self._map = None
+        self.routes = None # KeyedStore {(name, date): Route}, filled by routes_organise.
+        self.stops = None # KeyedStore {(name, date): StopList}, filled by stops_organise.
+        self.stops_table = None # One row per stop with its vehicle, date, city and position in its list, filled by stops_organise.
+        self.unparsed_times = {} # {col_name: index of the rows whose time could not be parsed}
+
+    @property
+    def map(self):
         """
-        self.dataset_routes = pd.read_csv(dataset_routes_loc).copy()
-        self.dataset_stops = pd.read_csv(dataset_stops_loc).copy()
-        self.map = folium.Map(location=[59.3293, 18.0686], zoom_start=12)
-        self.routes = None
-        self.stops = None
+        The map the dataset is visualised on, created on first use so that folium is only imported when drawing.
+        """
+        if self._map is None:
+            import folium
+            self._map = folium.Map(location=[59.3293, 18.0686], zoom_start=12)
+        return self._map
+
+    @map.setter
+    def map(self, map):
+        self._map = map
 
-    def time_normalisation(self, dataset:pd, col_name:str):
+    @stage(counts=lambda result, **_: {'rows': len(result)})
+    def read_dataset(self, loc:str) -> pd:
+        """
+        Read a dataset from its cached normalised version if there is one, otherwise from the source file.
+        """
+        if self.cache is not None:
+            dataset = self.cache.load(loc)
+            if dataset is not None:
+                return dataset
+        return pd.read_csv(loc)
+
+    @stage(counts=lambda result, dataset, **_: {'rows': len(dataset)})
+    def time_normalisation(self, dataset:pd, col_name:str, time_shift:float=0, source_tz:str=None, target_tz:str=None):
         """
         Normalise the time feature of the dataset to standard time values and add a date feature to the dataset for grouping.
+        The rows whose time could not be parsed are kept with NaT and reported in self.unparsed_times.
+        A dataset loaded from the cache is already normalised and left as it is.
+        The normalised stops and routes datasets are saved into the cache if there is one, before their times are aligned.
 
         Arguments:
         dataset: The dataset to be normalised.
         col_name: The name of the column in the dataset representing the time.
+        time_shift, source_tz, target_tz: How the clock of the dataset is aligned with the other one, see align_times.
+        """
+        if dataset.attrs.get('normalised') != col_name:
+            self.parse_times(dataset, col_name)
+        self.align_times(dataset, time_shift, source_tz, target_tz)
+
+    def parse_times(self, dataset:pd, col_name:str):
+        """
+        Parse the time column of a dataset and store it into the cache, see time_normalisation.
+        """
+        dataset['timevalue'], dataset['date'], unparsed = tools.parse_times(dataset[col_name], dayfirst=True)
+        if len(unparsed):
+            self.unparsed_times[col_name] = self.unparsed_times.get(col_name, pd.Index([])).append(unparsed)
+            warnings.warn(f"{len(unparsed)} rows of '{col_name}' could not be parsed, e.g. '{dataset[col_name][unparsed[0]]}'.")
+        dataset.attrs['normalised'] = col_name
+
+        if self.cache is not None:
+            if dataset is self.dataset_routes:
+                self.cache.store(self.dataset_routes_loc, dataset)
+            elif dataset is self.dataset_stops:
+                self.cache.store(self.dataset_stops_loc, dataset)
+
+    def align_times(self, dataset:pd, time_shift:float=0, source_tz:str=None, target_tz:str=None):
+        """
+        Bring the normalised times of a dataset onto the clock of the other one and recalculate their dates.
+        With timezones, the times are converted from source_tz to target_tz, so the offset follows the daylight saving changes,
+        e.g. source_tz='UTC' and target_tz='Europe/Stockholm' for POD times in UTC and GPS times in Swedish local time.
+        time_shift adds a fixed number of hours on top, and is enough alone when both datasets are on the same side of every DST change.
+        The alignment is recorded in dataset.attrs['time_alignment'], and a previous different alignment is undone first,
+        so aligning a dataset again the same way leaves it as it is.
+
+        Arguments:
+        dataset: The normalised dataset.
+        time_shift: The number of hours added to the times.
+        source_tz, target_tz: The timezones of the clocks of this dataset and of the other one. Both or neither.
         """
-        dataset['timevalue'] = pd.to_datetime(dataset[col_name], format='mixed', dayfirst=True) 
+        if (source_tz is None) != (target_tz is None):
+            raise ValueError('align_times needs both source_tz and target_tz, or neither.')
+        alignment = [time_shift, source_tz, target_tz]
+        (applied_shift, applied_source, applied_target) = dataset.attrs.get('time_alignment', [0, None, None])
+        if alignment == [applied_shift, applied_source, applied_target]:
+            return
+        times = tools.convert_clock(dataset['timevalue'] - pd.Timedelta(hours=applied_shift), applied_target, applied_source)
+        dataset['timevalue'] = tools.convert_clock(times, source_tz, target_tz) + pd.Timedelta(hours=time_shift)
         dataset['date'] = dataset['timevalue'].dt.date
+        dataset.attrs['time_alignment'] = alignment
 
-    def routes_organise(self, col_names:list):
+    @stage(counts=lambda result, self, **_: {'partitions': len(self.route_partitions)})
+    def routes_partition(self, col_name:str, col_names:list):
+        """
+        Stream the routes dataset in chunks, normalise the time of each chunk and distribute its rows into partitions by col_names.
+        Only one chunk is held in memory at a time when partition_dir is given.
+
+        Arguments:
+        col_name: The name of the column in the dataset representing the time.
+        col_names: A list containing features according to which the routes are grouped.
+        """
+        if self.chunksize is None:
+            raise ValueError('routes_partition needs the dataset to be created with a chunksize.')
+        if self.partition_dir is not None:
+            os.makedirs(self.partition_dir, exist_ok=True)
+
+        partitions = {}
+        for chunk in pd.read_csv(self.dataset_routes_loc, chunksize=self.chunksize):
+            self.time_normalisation(chunk, col_name)
+            for group_keys, data in tools.group_data(chunk, col_names):
+                if self.partition_dir is None:
+                    partitions.setdefault(group_keys, []).append(data)
+                    continue
+                if group_keys not in partitions:
+                    partitions[group_keys] = os.path.join(self.partition_dir, f'partition_{len(partitions)}.pkl')
+                    open(partitions[group_keys], 'wb').close()
+                with open(partitions[group_keys], 'ab') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.partition_cols = list(col_names)
+        self.route_partitions = partitions
+
+    def load_partition(self, group_keys:tuple) -> pd:
+        """
+        Returns all the rows of a partition made by routes_partition as one dataset.
+        """
+        return read_partition(self.route_partitions[group_keys])
+
+    @stage(counts=lambda result, self, kind, **_: {'partitions': len(result), 'built': len(self.changed_partitions[kind])})
+    def organise_incremental(self, kind:str, dataset:pd, col_names:list, prefix:str, build, workers:int=None) -> KeyedStore:
+        """
+        Organise a dataset partition by partition, taking the unchanged partitions from self.store.
+
+        Arguments:
+        kind: 'routes' or 'stops'.
+        dataset: The normalised dataset.
+        col_names: A list containing features according to which the dataset is partitioned.
+        prefix: The prefix of the names of the results, 'GPS-' or 'POD-'.
+        build: build_route or build_stops.
+        workers: The number of processes building the changed partitions.
+
+        Returns:
+        The store of results in group order, as built by routes_organise or stops_organise.
+        """
+        grouped_dataset = tools.group_data(dataset, col_names)
+        watermarks = grouped_dataset['timevalue'].agg(['size', 'max'])
+        indices = grouped_dataset.indices
+        results = KeyedStore(prefix=prefix)
+        changed = []
+        for (group_keys, (rows, last_time)) in zip(watermarks.index, watermarks.itertuples(index=False)):
+            group_keys = group_keys if isinstance(group_keys, tuple) else (group_keys,)
+            data = dataset.iloc[indices[group_keys if len(group_keys) > 1 else group_keys[0]]]
+            if self.store.unchanged(kind, group_keys, rows, last_time, data if self.verify else None):
+                results[group_keys] = self.store.load(kind, group_keys)
+            else:
+                results[group_keys] = None
+                changed.append((group_keys, data, last_time))
+
+        built = map_groups(build, [results.name(group_keys) for (group_keys, _, _) in changed], [data for (_, data, _) in changed], workers=workers)
+        for ((group_keys, data, last_time), result) in zip(changed, built):
+            results[group_keys] = result
+            self.store.save(kind, group_keys, result, data, last_time)
+        self.store.commit()
+        self.changed_partitions[kind] = [group_keys for (group_keys, _, _) in changed]
+        return results
+
+    @stage(counts=lambda result, self, **_: {'routes': len(self.routes), 'points': sum(len(route.times) for route in self.routes.values())})
+    def routes_organise(self, col_names:list, workers:int=None):
         """
         Group the routes according to the routines' names and sort them according to the time.
-        Then store the grouped and sorted ones into the self.routes.
+        Then store the grouped and sorted ones into the self.routes, keyed by the values of col_names, e.g. ('W904', date(2023, 9, 1)).
+        If the routes dataset was streamed by routes_partition, the routes are built one partition at a time.
 
         Arguments:
         col_names: A list containing features according to which the routes are grouped.
+        workers: The number of processes building the routes. The result is the same as the serial one.
         """
-        routes = {}
-        grouped_dataset = tools.group_data(self.dataset_routes, col_names)
-        for group_keys, data in grouped_dataset:
-            data_sorted = data.sort_values(by='timevalue')
-            route = instances.Route('GPS-' + f'{"-".join(map(str, group_keys))}', data_sorted)
-            routes[route.name] = route
-        self.routes = routes
+        if self.store is not None:
+            if self.route_partitions is not None:
+                raise ValueError('Incremental organising works on a loaded routes dataset, not on streamed partitions.')
+            self.routes = self.organise_incremental('routes', self.dataset_routes, col_names, 'GPS-', build_route, workers)
+            return
+        if self.route_partitions is not None:
+            if list(col_names) != self.partition_cols:
+                raise ValueError(f'The routes were partitioned by {self.partition_cols}, not {col_names}.')
+            groups_keys = sorted(self.route_partitions)
+            groups_data = (self.route_partitions[group_keys] for group_keys in groups_keys)
+        else:
+            grouped_dataset = tools.group_data(self.dataset_routes, col_names)
+            groups_keys = list(grouped_dataset.groups)
+            groups_data = (data for _, data in grouped_dataset)
+        self.routes = KeyedStore(prefix='GPS-')
+        groups_keys = [group_keys if isinstance(group_keys, tuple) else (group_keys,) for group_keys in groups_keys]
+        routes = map_groups(build_route, [self.routes.name(group_keys) for group_keys in groups_keys], groups_data, workers=workers)
+        for (group_keys, route) in zip(groups_keys, routes):
+            self.routes[group_keys] = route
 
-    def stops_organise(self, col_names:list):
+    @stage(counts=lambda result, self, **_: {'groups': len(self.stops), 'stops': sum(map(len, self.stops.values()))})
+    def stops_organise(self, col_names:list, workers:int=None):
         """
         Group the destinations according to the stops' names and col_names.
-        Then store the grouped and sorted ones into the self.destinations.
+        Then store the grouped and sorted ones into the self.stops, keyed by the values of col_names, e.g. ('W904', date(2023, 9, 1)).
 
         Arguments:
         col_names: A list containing features according to which the routes are grouped.
+        workers: The number of processes building the stops. The result is the same as the serial one.
         """
-        stops = {}
+        self.stops_table = self.index_stops(col_names)
+        if self.store is not None:
+            self.stops = self.organise_incremental('stops', self.dataset_stops, col_names, 'POD-', build_stops, workers)
+            return
         grouped_dataset = tools.group_data(self.dataset_stops, col_names)
-        for group_keys, group in grouped_dataset:
-            stops_sorted = group.sort_values(by='timevalue') # Sorting this helps find the nearest GPS points.
-            for _, data in stops_sorted.iterrows():
-                stop = instances.Stop(data)
-                # To initialise the empty dictionary.
-                if 'POD-' + f'{"-".join(map(str, group_keys))}' not in stops:
-                    # Example key for stops in the dictionary: 'W904-2023-09-01'
-                    stops['POD-' + f'{"-".join(map(str, group_keys))}'] = [stop]
-                else:
-                    stops['POD-' + f'{"-".join(map(str, group_keys))}'].append(stop)
-        self.stops = stops
\ No newline at end of file
+        self.stops = KeyedStore(prefix='POD-')
+        groups_keys = [group_keys if isinstance(group_keys, tuple) else (group_keys,) for group_keys in grouped_dataset.groups]
+        stops_lists = map_groups(build_stops, [self.stops.name(group_keys) for group_keys in groups_keys], (group for _, group in grouped_dataset), workers=workers)
+        for (group_keys, stops) in zip(groups_keys, stops_lists):
+            self.stops[group_keys] = stops
+
+    def index_stops(self, col_names:list) -> pd:
+        """
+        The columns of the stops needed to select them with boolean masks, in the order of the stops built by stops_organise.
+
+        Arguments:
+        col_names: The features the stops are grouped by, the vehicle name and the date.
+
+        Returns:
+        A table with the columns 'vehicle', 'date' (as datetime64), 'city' and 'position', the index of the stop in its group's list.
+        """
+        if len(col_names) != 2:
+            return None
+        stops = self.dataset_stops.dropna(subset=list(col_names))
+        stops = stops.sort_values(list(col_names) + ['timevalue'], kind='stable')
+        return pd.DataFrame({
+            'vehicle': stops[col_names[0]].to_numpy(),
+            'date': pd.to_datetime(stops[col_names[1]]).to_numpy(dtype='datetime64[ns]'),
+            'city': stops['Address.City'].to_numpy(),
+            'position': stops.groupby(list(col_names), sort=False).cumcount().to_numpy(),
+        })
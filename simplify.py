@@ -0,0 +1,75 @@
+import numpy as np
+import metrics
+
+EQUATOR_METERS_PER_PIXEL = 156543.03392 # Web Mercator meters per pixel at zoom 0 on the equator.
+
+# Zoom bands [minzoom, maxzoom) between which the map switches geometry resolutions.
+ZOOM_BANDS = [(0, 12), (12, 14), (14, 16), (16, 30)]
+MAX_ZOOM = 18 # The most detailed zoom of the tile layers, used as the resolution of the last band.
+
+def meters_per_pixel(zoom:float, lat:float) -> float:
+    """
+    The ground size of a screen pixel on a Web Mercator map.
+
+    Arguments:
+    zoom: The zoom level.
+    lat: The latitude in degrees.
+    """
+    return EQUATOR_METERS_PER_PIXEL * np.cos(np.radians(lat)) / 2**zoom
+
+def douglas_peucker(xs:np.ndarray, ys:np.ndarray, tolerance:float) -> np.ndarray:
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm.
+    The recursion is unrolled into a stack, and the distances of all the points of a span to its chord are computed at once.
+
+    Arguments:
+    xs, ys: Projected coordinates of the vertices.
+    tolerance: The maximum distance between the original and the simplified line, in the units of xs and ys.
+
+    Returns:
+    A boolean mask of the vertices kept.
+    """
+    n = len(xs)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = xs[last] - xs[first], ys[last] - ys[first]
+        px, py = xs[first+1:last] - xs[first], ys[first+1:last] - ys[first]
+        length_sq = dx**2 + dy**2
+        if length_sq == 0:
+            distances = np.hypot(px, py)
+        else:
+            # Distance to the chord as a segment, so that lines turning back on themselves are kept.
+            t = np.clip((px * dx + py * dy) / length_sq, 0, 1)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return keep
+
+def multiresolution(lats:np.ndarray, lons:np.ndarray, zoom_bands:list=ZOOM_BANDS, pixel_tolerance:float=0.5) -> list:
+    """
+    Simplify a polyline once per zoom band, with a tolerance of pixel_tolerance pixels at the most detailed zoom of the band.
+
+    Arguments:
+    lats, lons: Coordinates of the vertices in degrees.
+    zoom_bands: A list of (minzoom, maxzoom).
+    pixel_tolerance: The tolerance in screen pixels.
+
+    Returns:
+    A list of boolean masks of the vertices kept, one per band.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    xs, ys = metrics.project(lats, lons)
+    lat = np.mean(lats) if len(lats) else 0.0
+    return [douglas_peucker(xs, ys, pixel_tolerance * meters_per_pixel(min(maxzoom - 1, MAX_ZOOM), lat)) for (_, maxzoom) in zoom_bands]
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import metrics
+import instances
+
+class PingIndex:
+    """
+    A spatio-temporal grid over the GPS points of many routes.
+    Points are bucketed into cells of cell_size meters and time_bucket seconds, and sorted by bucket,
+    so the candidates of a query are found with binary searches over the neighbouring buckets.
+    """
+    def __init__(self, routes:dict, cell_size:float=50, time_bucket:float=600):
+        """
+        Parameters:
+        routes: A dictionary of columnar routes, e.g. GroupedDataset.routes or the output of cluster.routes_filter.
+        cell_size: The side of a grid cell in meters.
+        time_bucket: The length of a time bucket in seconds.
+        """
+        self.route_keys = list(routes)
+        self.cell_size = cell_size
+        self.time_bucket = time_bucket
+        offsets, self.route_ids, times, self.lats, self.lons, _ = instances.Route.concatenate([routes[key] for key in self.route_keys])
+        self.times = times.astype(np.int64) / 1e9
+        self.point_indices = np.arange(len(self.lats)) - offsets[self.route_ids]
+
+        self.cos_lat = metrics.reference_cos(self.lats)
+        cells = self.cells(self.lats, self.lons, self.times)
+        self.origin = cells.min(axis=0) if len(cells) else np.zeros(3, dtype=np.int64)
+        self.shape = (cells.max(axis=0) - self.origin + 1) if len(cells) else np.ones(3, dtype=np.int64)
+        keys = self.pack(cells - self.origin)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def cells(self, lats:np.ndarray, lons:np.ndarray, times:np.ndarray) -> np.ndarray:
+        """
+        The (x, y, t) bucket of every coordinate, as an integer array of shape (n, 3).
+        """
+        xs, ys = metrics.project(lats, lons, self.cos_lat)
+        return np.column_stack((np.floor(xs / self.cell_size), np.floor(ys / self.cell_size), np.floor(times / self.time_bucket))).astype(np.int64)
+
+    def pack(self, cells:np.ndarray) -> np.ndarray:
+        return (cells[:, 2] * self.shape[1] + cells[:, 1]) * self.shape[0] + cells[:, 0]
+
+    def query(self, lats:np.ndarray, lons:np.ndarray, times, radius:float=50, window:float=600) -> pd.DataFrame:
+        """
+        Find all the points within radius meters and window seconds of every query, for all the queries at once.
+
+        Arguments:
+        lats, lons: Coordinates of the queries in degrees.
+        times: Times of the queries, as datetime64 values or Timestamps.
+        radius: The search radius in meters.
+        window: The half length of the search window in seconds.
+
+        Returns:
+        A table of candidate pairs: the query position, the route key, the point index in the route,
+        the distance in meters and the time difference in seconds (point minus query).
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        times = np.asarray(pd.to_datetime(times), dtype='datetime64[ns]').astype(np.int64) / 1e9
+        columns = ['query', 'route', 'point_index', 'distance', 'dt']
+        if len(lats) == 0 or len(self.keys) == 0:
+            return pd.DataFrame({column: [] for column in columns})
+
+        reach = np.array([int(np.ceil(radius / self.cell_size))] * 2 + [int(np.ceil(window / self.time_bucket))])
+        offsets = np.stack(np.meshgrid(*(np.arange(-r, r + 1) for r in reach), indexing='ij'), axis=-1).reshape(-1, 3)
+        neighbours = (self.cells(lats, lons, times) - self.origin)[:, None, :] + offsets[None, :, :]
+        valid = np.all((neighbours >= 0) & (neighbours < self.shape), axis=2)
+        keys = self.pack(neighbours.reshape(-1, 3)).reshape(valid.shape)
+        starts = np.where(valid, np.searchsorted(self.keys, keys, side='left'), 0)
+        ends = np.where(valid, np.searchsorted(self.keys, keys, side='right'), 0)
+
+        # Expand every [start, end) range into the positions it contains.
+        counts = (ends - starts).ravel()
+        queries = np.repeat(np.repeat(np.arange(len(lats)), offsets.shape[0]), counts)
+        positions = np.repeat(starts.ravel() - np.concatenate(([0], np.cumsum(counts)[:-1])), counts) + np.arange(counts.sum())
+        points = self.order[positions]
+
+        distances = metrics.haversine(lats[queries], lons[queries], self.lats[points], self.lons[points]) * 1000
+        dts = self.times[points] - times[queries]
+        inside = (distances <= radius) & (np.abs(dts) <= window)
+        queries, points = queries[inside], points[inside]
+        return pd.DataFrame({
+            'query': queries,
+            'route': [self.route_keys[i] for i in self.route_ids[points]],
+            'point_index': self.point_indices[points],
+            'distance': distances[inside],
+            'dt': dts[inside],
+        }, columns=columns)
+
+    def query_stops(self, stops:dict, radius:float=50, window:float=600) -> pd.DataFrame:
+        """
+        Run query for every stop.
+
+        Arguments:
+        stops: A dictionary {key: [Stop1, Stop2, ...]}, e.g. GroupedDataset.stops or the output of cluster.stops_filter.
+        radius, window: See query.
+
+        Returns:
+        The table of query, with the query position replaced by the stop key and the index of the stop in its list.
+        """
+        keys = list(stops)
+        groups, stop_indices, times, lats, lons, _ = instances.StopList.flatten(stops)
+        candidates = self.query(lats, lons, times, radius, window)
+        queries = candidates.pop('query').to_numpy(dtype=np.int64)
+        candidates.insert(0, 'stop_index', stop_indices[queries] if len(queries) else [])
+        candidates.insert(0, 'stop', [keys[i] for i in groups[queries]])
+        return candidates
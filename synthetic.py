@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pandas as pd
+
+GPS_TIME_FORMAT = '%d/%m/%Y %H:%M:%S' # As in the 'Tid' column of the GPS exports.
+POD_TIME_FORMAT = '%Y-%m-%d %H:%M:%S' # As in the 'DeliveredAt' column of the POD exports.
+POD_TIME_SHIFT = -2 # The POD exports are two hours behind the GPS ones, see the time_shift of GroupedDataset.time_normalisation.
+EVENTS = np.array(['Position', 'Start', 'Stop'], dtype=object)
+CITIES = np.array(['Stockholm', 'Solna', 'Sundbyberg', 'Nacka'], dtype=object)
+
+def synthetic_route(rng:np.random.Generator, pings:int, day:pd.Timestamp, center:tuple, dwell_share:float=0.3) -> pd:
+    """
+    Generate the GPS points of one vehicle on one day as a random walk with stationary periods.
+
+    Arguments:
+    rng: The random generator.
+    pings: The number of GPS points.
+    day: The date of the route.
+    center: The (lat, lon) the route starts around.
+    dwell_share: The share of the points at which the vehicle stands still.
+
+    Returns:
+    A dataset with the columns 'Tid' (as a datetime), 'Lat', 'Long', 'Hastighet' and 'Händelse'.
+    """
+    stationary = rng.random(pings) < dwell_share
+    intervals = rng.integers(5, 60, size=pings)
+    # Moving points drive about 30 km/h, so the steps follow the time between the points.
+    speeds = np.where(stationary, rng.uniform(0, 1, size=pings), rng.uniform(10, 50, size=pings))
+    steps = speeds / 3.6 * intervals / 111320 # In degrees of latitude.
+    headings = np.cumsum(rng.normal(0, 0.5, size=pings))
+    lats = center[0] + rng.normal(0, 0.01) + np.cumsum(steps * np.cos(headings))
+    lons = center[1] + rng.normal(0, 0.02) + np.cumsum(steps * np.sin(headings) / np.cos(np.radians(center[0])))
+    start = day + pd.Timedelta(hours=6) + pd.Timedelta(seconds=int(rng.integers(0, 3600)))
+    times = start + pd.to_timedelta(np.cumsum(intervals), unit='s')
+    events = np.where(stationary, EVENTS[2], EVENTS[0])
+    events[0] = EVENTS[1]
+    return pd.DataFrame({'Tid': times, 'Lat': lats, 'Long': lons, 'Hastighet': np.round(speeds, 1), 'Händelse': events})
+
+def synthetic_stops(rng:np.random.Generator, route:pd, stops:int) -> pd:
+    """
+    Generate the deliveries of one route, placed a few meters away from some of its stationary points.
+
+    Arguments:
+    rng: The random generator.
+    route: The output of synthetic_route.
+    stops: The number of deliveries.
+
+    Returns:
+    A dataset with the columns 'DeliveredAt' (as a datetime, in the time of the POD exports),
+    'ConfirmedCoordinates.Latitude', 'ConfirmedCoordinates.Longitude' and 'Address.City'.
+    """
+    candidates = np.nonzero(route['Händelse'].to_numpy() == EVENTS[2])[0]
+    if len(candidates) == 0:
+        candidates = np.arange(len(route))
+    rows = np.sort(rng.choice(candidates, size=min(stops, len(candidates)), replace=False))
+    return pd.DataFrame({
+        'DeliveredAt': route['Tid'].to_numpy()[rows] + pd.Timedelta(hours=POD_TIME_SHIFT) + pd.to_timedelta(rng.integers(0, 30, size=len(rows)), unit='s'),
+        'ConfirmedCoordinates.Latitude': route['Lat'].to_numpy()[rows] + rng.normal(0, 0.0002, size=len(rows)),
+        'ConfirmedCoordinates.Longitude': route['Long'].to_numpy()[rows] + rng.normal(0, 0.0004, size=len(rows)),
+        'Address.City': rng.choice(CITIES, size=len(rows)),
+    })
+
+def generate(routes_csv:str, stops_csv:str, pings:int=10**5, vehicles:int=10, start_date:str='2023-08-01', stops_per_route:int=40,
+             seed:int=0, center:tuple=(59.3293, 18.0686)):
+    """
+    Write synthetic GPS and POD datasets with the columns read by GroupedDataset, Route and Stop.
+    The pings are spread evenly over the vehicles and as many days as needed for about 1000 points per route,
+    and the files are written one route at a time, so that 10^7 pings do not have to fit in memory at once.
+
+    Arguments:
+    routes_csv: The location of the GPS dataset to write.
+    stops_csv: The location of the POD dataset to write.
+    pings: The total number of GPS points, e.g. from 10^3 to 10^7.
+    vehicles: The number of vehicles.
+    start_date: The date of the first day.
+    stops_per_route: The number of deliveries per vehicle and day.
+    seed: The seed of the random generator, so that the same arguments always give the same files.
+    center: The (lat, lon) the routes are generated around.
+    """
+    rng = np.random.default_rng(seed)
+    vehicles = max(1, min(vehicles, pings))
+    days = max(1, pings // (vehicles * 1000))
+    routes = vehicles * days
+    sizes = np.full(routes, pings // routes)
+    sizes[:pings % routes] += 1
+    names = [f'V{i:03d}' for i in range(vehicles)]
+    dates = pd.date_range(start_date, periods=days, freq='D')
+
+    for path in (routes_csv, stops_csv):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = True
+    with open(routes_csv, 'w', encoding='utf-8', newline='') as routes_file, open(stops_csv, 'w', encoding='utf-8', newline='') as stops_file:
+        for (i, size) in enumerate(sizes):
+            if size == 0:
+                continue
+            name, day = names[i % vehicles], dates[i // vehicles]
+            route = synthetic_route(rng, int(size), day, center)
+            stops = synthetic_stops(rng, route, stops_per_route)
+            route['Tid'] = route['Tid'].dt.strftime(GPS_TIME_FORMAT)
+            route['Name'] = name
+            stops['DeliveredAt'] = stops['DeliveredAt'].dt.strftime(POD_TIME_FORMAT)
+            stops.insert(1, 'Ruttnamn', name)
+            route.to_csv(routes_file, index=False, header=header)
+            stops.to_csv(stops_file, index=False, header=header)
+            header = False
+
+if __name__ == '__main__':
+    generate('Datasets/Synthetic/GPS.csv', 'Datasets/Synthetic/POD.csv', pings=10**5)
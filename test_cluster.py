@@ -0,0 +1,64 @@
+import pytest
+import synthetic
+import cluster
+from process import GroupedDataset
+
+def two_pointer_match(stops:list, points:list) -> dict:
+    """
+    The original search of cluster.find_nearest_trips, walking the stops and the points of one route together.
+
+    Returns:
+    A dictionary {stop index: index of the start point of its trip}.
+    """
+    matches = {}
+    i = 0
+    j = 1
+    while i < len(stops) and j < len(points):
+        if points[j-1].time <= stops[i].time <= points[j].time:
+            matches[i] = j - 1
+            i += 1
+        else:
+            j += 1
+    return matches
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('synthetic')
+    routes_csv, stops_csv = str(data_dir / 'GPS.csv'), str(data_dir / 'POD.csv')
+    synthetic.generate(routes_csv, stops_csv, pings=6000, vehicles=3, stops_per_route=30)
+    dataset = GroupedDataset(stops_csv, routes_csv)
+    dataset.time_normalisation(dataset.dataset_routes, 'Tid')
+    dataset.time_normalisation(dataset.dataset_stops, 'DeliveredAt', time_shift=-synthetic.POD_TIME_SHIFT)
+    dataset.routes_organise(['Name', 'date'])
+    dataset.stops_organise(['Ruttnamn', 'date'])
+    return dataset
+
+def test_match_agrees_with_two_pointer_search(dataset):
+    filtered_stops, stops_dates = cluster.stops_filter(dataset)
+    filtered_routes = cluster.routes_filter(dataset, stops_dates)
+    table = cluster.find_nearest_trips(filtered_stops, filtered_routes)
+
+    compared = 0
+    for (key, stops) in filtered_stops.items():
+        route = filtered_routes[key]
+        rows = table[(table['name'] == key[0]) & (table['date'] == key[1])].set_index('stop_index')
+        for (i, start) in two_pointer_match(stops, route.points).items():
+            assert rows.loc[i, 'status'] == cluster.MATCHED
+            assert rows.loc[i, 'start_index'] == start
+            trip = stops[i].nearest_trip
+            assert trip.start.time <= stops[i].time <= trip.end.time
+            assert [point.index for point in stops[i].parked_points] == [index for index in (start, start + 1) if route.speeds[index] <= 1]
+            compared += 1
+    assert compared > 0
+
+def test_unmatched_stops_are_outside_their_route(dataset):
+    filtered_stops, stops_dates = cluster.stops_filter(dataset)
+    table = cluster.find_nearest_trips(filtered_stops, cluster.routes_filter(dataset, stops_dates))
+    for row in table[table['status'] != cluster.MATCHED].itertuples():
+        stop = filtered_stops[(row.name, row.date)][row.stop_index]
+        route = dataset.routes[(row.name, row.date)]
+        assert stop.nearest_trip is None
+        if row.status == cluster.BEFORE_FIRST:
+            assert stop.time < route.points[0].time
+        else:
+            assert stop.time > route.points[-1].time
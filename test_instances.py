@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import instances
+
+def stop_list(n:int, base:float) -> instances.StopList:
+    return instances.StopList(pd.DataFrame({
+        'timevalue': pd.date_range('2023-08-10', periods=n, freq='h') + pd.Timedelta(days=base),
+        'ConfirmedCoordinates.Latitude': base + np.arange(n),
+        'ConfirmedCoordinates.Longitude': base + 2.0 * np.arange(n),
+        'Address.City': ['Stockholm'] * n,
+    }))
+
+def test_flatten_reads_lists_and_views():
+    a, b = stop_list(5, 0), stop_list(4, 100)
+    a[1].nearest_trip = 'trip'
+    stops = {'filtered': [a[3], a[1], b[2], b[0]], 'whole': b, 'empty': []}
+    groups, indices, times, lats, lons, trips = instances.StopList.flatten(stops)
+    views = [stop for stop_list in stops.values() for stop in stop_list]
+    assert groups.tolist() == [0, 0, 0, 0, 1, 1, 1, 1]
+    assert indices.tolist() == [0, 1, 2, 3, 0, 1, 2, 3]
+    assert [pd.Timestamp(time) for time in times] == [stop.time for stop in views]
+    assert np.column_stack((lats, lons)).tolist() == [stop.loc for stop in views]
+    assert trips.tolist() == [None, 'trip'] + [None] * 6
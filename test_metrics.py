@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+import metrics
+
+geopy = pytest.importorskip('geopy')
+from geopy.distance import geodesic
+
+def test_ellipsoidal_matches_geopy():
+    rng = np.random.default_rng(0)
+    lats1, lats2 = rng.uniform(-80, 80, size=(2, 500))
+    lons1, lons2 = rng.uniform(-180, 180, size=(2, 500))
+    # Short hops at the scale of a route, and points on the same meridian and on the equator.
+    lats2[:200] = lats1[:200] + rng.normal(0, 0.01, size=200)
+    lons2[:200] = lons1[:200] + rng.normal(0, 0.01, size=200)
+    lons2[200], lats1[201], lats2[201] = lons1[200], 0, 0
+    distances = metrics.ellipsoidal(lats1, lons1, lats2, lons2)
+    expected = [geodesic(p, q).km for (p, q) in zip(zip(lats1, lons1), zip(lats2, lons2))]
+    assert np.allclose(distances, expected, rtol=0, atol=metrics.ELLIPSOIDAL_TOLERANCE)
+
+def test_ellipsoidal_missing_coordinates():
+    distances = metrics.ellipsoidal([59.3, np.nan, 59.3, 59.3], [18.0, 18.0, np.nan, 18.0], [59.4, 59.4, 59.4, 59.3], [18.1, 18.1, 18.1, 18.0])
+    assert np.isnan(distances[1]) and np.isnan(distances[2])
+    assert distances[0] == pytest.approx(geodesic((59.3, 18.0), (59.4, 18.1)).km, abs=metrics.ELLIPSOIDAL_TOLERANCE)
+    assert distances[3] == 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+nx = pytest.importorskip('networkx')
+pytest.importorskip('scipy')
+from oracle import DistanceOracle
+
+@pytest.fixture(scope='module')
+def city():
+    """
+    A 30 x 30 street grid with a few one-way and missing streets, and one node cut off from the rest.
+    """
+    rng = np.random.default_rng(0)
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    size = 30
+    for i in range(size):
+        for j in range(size):
+            G.add_node(i * size + j, y=59.30 + i * 0.0015 + rng.normal(0, 1e-4), x=18.00 + j * 0.0025 + rng.normal(0, 1e-4))
+    for i in range(size):
+        for j in range(size):
+            for (di, dj) in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+                if 0 <= i + di < size and 0 <= j + dj < size and rng.random() > 0.1:
+                    G.add_edge(i * size + j, (i + di) * size + j + dj, length=float(rng.uniform(100, 200)))
+    G.add_node(-1, y=59.29, x=17.99)
+    return G
+
+@pytest.fixture(scope='module')
+def oracle(city, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('oracle') / 'oracle.npz')
+    DistanceOracle.from_graph(city, landmarks=8).save(path)
+    return DistanceOracle.load(path)
+
+def path_length(G, path:list) -> float:
+    return sum(min(data['length'] for data in G[u][v].values()) for (u, v) in zip(path, path[1:]))
+
+def test_keeps_the_largest_strongly_connected_component(city, oracle):
+    largest = max(nx.strongly_connected_components(city), key=len)
+    assert set(oracle.nodes.tolist()) == largest
+    assert len(oracle.landmarks) == 8
+
+def test_distances_and_paths_match_networkx(city, oracle):
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        (u, v) = rng.choice(oracle.nodes, size=2).tolist()
+        expected = nx.shortest_path_length(city, u, v, weight='length')
+        assert oracle.distance(u, v) == pytest.approx(expected)
+        path = oracle.path(u, v)
+        assert path[0] == u and path[-1] == v
+        assert path_length(city, path) == pytest.approx(expected)
+
+def test_matrix_matches_networkx(city, oracle):
+    rng = np.random.default_rng(2)
+    nodes = rng.choice(oracle.nodes, size=12).tolist()
+    lats = [city.nodes[node]['y'] for node in nodes]
+    lons = [city.nodes[node]['x'] for node in nodes]
+    distances = oracle.matrix(lats[:5], lons[:5], lats[5:], lons[5:])
+    assert distances.shape == (5, 7)
+    for (i, u) in enumerate(nodes[:5]):
+        for (j, v) in enumerate(nodes[5:]):
+            assert distances[i, j] == pytest.approx(nx.shortest_path_length(city, u, v, weight='length'))
+    travel_times = oracle.travel_times(list(zip(lats, lons)), speed=36)
+    assert np.allclose(np.diag(travel_times), 0)
+    assert travel_times[0, 5] == pytest.approx(distances[0, 0] / 10)
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+import tools
+from process import GroupedDataset
+
+def test_parse_times_mixed_formats_and_offsets():
+    values = pd.Series(['2023-08-10 06:11:39+02:00', '2023-12-10 06:11:39+01:00', '2023-12-10T06:11:39Z', '10/08/2023 06:11:39',
+                        '2023-08-10 06:11:39', np.nan, 'garbage', '2023-08-10 06:11', '31/12/2023', '10/08/2023 06:11:39'])
+    times, dates, unparsed = tools.parse_times(values)
+    expected = pd.to_datetime(['2023-08-10 06:11:39', '2023-12-10 06:11:39', '2023-12-10 06:11:39', '2023-08-10 06:11:39',
+                               '2023-08-10 06:11:39', None, None, '2023-08-10 06:11', '2023-12-31', '2023-08-10 06:11:39'], format='mixed')
+    assert times.isna().tolist() == expected.isna().tolist()
+    assert (times[times.notna()] == expected[expected.notna()]).all()
+    assert dates[0] == pd.Timestamp('2023-08-10').date()
+    # Missing values are not reported as unparsed, garbage is.
+    assert list(unparsed) == [6]
+
+def test_time_normalisation_reports_unparsed_rows(tmp_path):
+    stops_csv, routes_csv = tmp_path / 'POD.csv', tmp_path / 'GPS.csv'
+    pd.DataFrame({'DeliveredAt': ['2023-08-10 06:11:39+02:00', '2023-12-10 06:11:39+01:00', 'not a time']}).to_csv(stops_csv, index=False)
+    pd.DataFrame({'Tid': ['10/08/2023 06:11:39']}).to_csv(routes_csv, index=False)
+    dataset = GroupedDataset(str(stops_csv), str(routes_csv))
+    dataset.time_normalisation(dataset.dataset_stops, 'DeliveredAt')
+    assert dataset.dataset_stops['timevalue'].tolist()[:2] == [pd.Timestamp('2023-08-10 06:11:39'), pd.Timestamp('2023-12-10 06:11:39')]
+    assert list(dataset.unparsed_times['DeliveredAt']) == [2]
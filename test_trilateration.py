@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import trilateration
+
+shapely = pytest.importorskip('shapely')
+from shapely.geometry import Point
+
+def buffered_intersection(centers:np.ndarray, radii:np.ndarray):
+    """
+    The intersection of circles approximated by polygons with shapely.
+    """
+    region = Point(centers[0]).buffer(radii[0], quad_segs=2048)
+    for (center, radius) in zip(centers[1:], radii[1:]):
+        region = region.intersection(Point(center).buffer(radius, quad_segs=2048))
+    return region
+
+def test_area_and_centroid_match_buffered_circles():
+    rng = np.random.default_rng(0)
+    compared = 0
+    for _ in range(100):
+        centers = rng.uniform(0, 100, size=(3, 2))
+        radii = rng.uniform(20, 80, size=3)
+        area, centroid = trilateration.intersection_region(centers, radii)
+        region = buffered_intersection(centers, radii)
+        assert area == pytest.approx(region.area, rel=1e-4, abs=1e-3)
+        if region.area > 1:
+            assert np.allclose(centroid, [region.centroid.x, region.centroid.y], atol=1e-3)
+            compared += 1
+    assert compared > 10
+
+def test_nested_and_disjoint_circles():
+    area, centroid = trilateration.intersection_region(np.array([[0, 0], [1, 0], [0, 1]]), np.array([10, 50, 50]))
+    assert area == pytest.approx(np.pi * 100)
+    assert np.allclose(centroid, [0, 0])
+    area, centroid = trilateration.intersection_region(np.array([[0, 0], [100, 0], [0, 1]]), np.array([10, 10, 50]))
+    assert area == 0
+    assert centroid is None
+
+def test_monte_carlo_agrees_with_exact_area():
+    centers = np.array([[0, 0], [30, 0], [15, 20]])
+    radii = np.array([25, 25, 25])
+    area, _ = trilateration.intersection_region(centers, radii)
+    assert trilateration.intersection_area_monte_carlo(centers, radii, trials=200000) == pytest.approx(area, rel=0.02)
@@ -1,23 +1,127 @@
+from __future__ import annotations
+import os
+import re
+import json
 import hashlib
-from folium import FeatureGroup
-import osmnx as ox
-import folium
+from functools import lru_cache
+from typing import TYPE_CHECKING
+import numpy as np
 import pandas as pd
-import branca.colormap as cm
-from folium import Popup
-from folium.plugins import PolyLineTextPath
+import simplify
+from instrumentation import stage
 
+# folium, branca and osmnx are only imported by the functions drawing maps, so that loading the data does not pay for them.
+if TYPE_CHECKING:
+    import folium
+    import osmnx as ox
+    import branca.colormap as cm
+    from folium import FeatureGroup
 
-def xlsx_to_csv(excel_file_path:str, csv_file_path:str):
+
+def xlsx_to_csv(excel_file_path:str, csv_file_path:str, overwrite:bool=False):
     """
     Transfer a .xlsx file into a .csv file.
+    The conversion is skipped if the .csv file is already newer than the .xlsx file, unless overwrite is set.
 
     Parameters:
     excel_file_path, csv_file_path: As the names indicated.
+    overwrite: Convert even if the .csv file is up to date.
     """
+    if not overwrite and os.path.exists(csv_file_path) and os.path.getmtime(csv_file_path) >= os.path.getmtime(excel_file_path):
+        return
     df = pd.read_excel(excel_file_path)
     df.to_csv(csv_file_path, index=False)
 
+# Formats tried for each group of timestamps sharing the same shape. Year-first formats do not depend on dayfirst.
+YEAR_FIRST_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%Y/%m/%d %H:%M:%S']
+# A UTC offset or Z written after the time, e.g. '2023-08-10 06:11:39+02:00'.
+UTC_OFFSET = r'^(.*\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s?(?:Z|[+-]\d{2}:?\d{2})$'
+DAY_FIRST_FORMATS = ['%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y']
+
+def parse_mixed(values:pd.Series, dayfirst:bool) -> pd.Series:
+    """
+    The fallback of parse_times, parsing every string on its own. Strings starting with a four-digit year are never read day first.
+    Groups which cannot be parsed together, e.g. because of different timezone names, become NaT.
+    """
+    year_first = values.str.match(r'\d{4}\D').to_numpy(dtype=bool)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for (mask, first) in ((year_first, False), (~year_first, dayfirst)):
+        if not mask.any():
+            continue
+        try:
+            result = pd.to_datetime(values[mask], format='mixed', dayfirst=first, errors='coerce')
+        except (ValueError, TypeError):
+            continue
+        if isinstance(result.dtype, pd.DatetimeTZDtype):
+            result = result.dt.tz_localize(None) # Keep the local wall-clock time, like the naive timestamps.
+        parsed[mask] = result.astype('datetime64[ns]')
+    return parsed
+
+def parse_times(values:pd.Series, dayfirst:bool=True) -> tuple:
+    """
+    Parse a column of timestamps written in a few different formats.
+    Only the unique strings are parsed. They are grouped by their shape (the string with every digit replaced by 0),
+    and each group is parsed with the first explicit format that fits it. Groups fitting none of the formats fall back to mixed parsing.
+    The results are broadcast back to all the rows.
+    UTC offsets are removed before parsing, so every time keeps its local wall-clock time, like the naive timestamps,
+    even when the offsets of one column differ across a daylight saving change. Strings which cannot be parsed become NaT.
+
+    Arguments:
+    values: The column of timestamps.
+    dayfirst: Whether ambiguous dates are written day first, as in pd.to_datetime.
+
+    Returns:
+    The parsed times and their dates as two Series aligned with values, and the index of the rows which could not be parsed.
+    """
+    formats = YEAR_FIRST_FORMATS + (DAY_FIRST_FORMATS if dayfirst else [f.replace('%d', '%D').replace('%m', '%d').replace('%D', '%m') for f in DAY_FIRST_FORMATS])
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=str)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+
+    for (shape, group) in uniques.groupby(uniques.str.replace(r'\d', '0', regex=True), sort=False):
+        if re.match(UTC_OFFSET, shape):
+            group = group.str.replace(UTC_OFFSET, r'\1', regex=True)
+        result = None
+        for time_format in formats:
+            if pd.isna(pd.to_datetime(group.iloc[:1], format=time_format, errors='coerce').iloc[0]):
+                continue
+            result = pd.to_datetime(group, format=time_format, errors='coerce')
+            break
+        if result is None or result.isna().any():
+            rest = group if result is None else group[result.isna()]
+            rest = parse_mixed(rest, dayfirst)
+            result = rest if result is None else result.where(result.notna(), rest)
+        parsed[group.index] = result.astype('datetime64[ns]')
+
+    # Missing values have the code -1 and take the NaT appended at the end.
+    times = np.append(parsed.to_numpy(), np.datetime64('NaT', 'ns'))[codes]
+    dates = np.append(parsed.dt.date.to_numpy(dtype=object), pd.NaT)[codes]
+    times = pd.Series(times, index=values.index)
+    unparsed = values.index[times.isna() & values.notna()]
+    return times, pd.Series(dates, index=values.index), unparsed
+
+def convert_clock(times:pd.Series, source_tz:str, target_tz:str) -> pd.Series:
+    """
+    Convert naive wall-clock times of one timezone into the wall-clock times of another, following the daylight saving changes of both.
+    Times repeated when the clocks go back are read as standard time, and times skipped when they go forward are moved to the end of the gap.
+
+    Arguments:
+    times: A column of naive datetimes.
+    source_tz, target_tz: Timezone names, e.g. 'UTC' and 'Europe/Stockholm'. The times are returned as they are if either is None.
+
+    Returns:
+    The converted naive datetimes.
+    """
+    if source_tz is None or target_tz is None or source_tz == target_tz:
+        return times
+    localised = times.dt.tz_localize(source_tz, ambiguous=False, nonexistent='shift_forward')
+    return localised.dt.tz_convert(target_tz).dt.tz_localize(None)
+
+# Properties shown in the popups of points drawn as GeoJSON, and their labels.
+POPUP_FIELDS = ['time', 'loc', 'name', 'type']
+POPUP_ALIASES = ['Time', 'Location', 'Rutt', 'Type']
+
+@lru_cache(maxsize=None)
 def get_color(input_string:str) -> str:
         """
         Generates a color for a route given its name.
@@ -28,6 +132,7 @@ def get_color(input_string:str) -> str:
         Returns:
         The color of the designated route.
         """
+        # Memoized: the same few route names and event types are coloured for every point drawn.
         hash_obj = hashlib.sha256(input_string.encode())
         return '#' + hash_obj.hexdigest()[:6]
 
@@ -41,6 +146,8 @@ def reverse_colormap(original_colormap:cm) -> cm:
     Returns:
     Reversed colormap.
     """
+    import branca.colormap as cm
+
     colors = original_colormap.colors
     reversed_colors = list(reversed(colors))
     
@@ -62,7 +169,174 @@ def group_data(dataset:pd, col_names:list) -> pd:
     """
     return dataset.groupby(col_names)
 
-def routes_plot(map:folium, routes:dict, filter:list=None, G:ox=None):
+def group_name(groups:dict, key, prefix:bool=True) -> str:
+    """
+    The display name of a group of routes or stops, e.g. 'POD-W904-2023-09-01', used for the map layers and popups.
+
+    Arguments:
+    groups: The dictionary or KeyedStore holding the group.
+    key: The key of the group, a tuple of group keys or already a name.
+    prefix: Whether the 'GPS-' or 'POD-' prefix of the store is included.
+    """
+    if isinstance(key, str):
+        return key if prefix else re.sub(r'^(GPS|POD)-', '', key)
+    key = key if isinstance(key, tuple) else (key,)
+    return (getattr(groups, 'prefix', '') if prefix else '') + '-'.join(map(str, key))
+
+def trips_colors(route) -> list:
+    """
+    The colors of the trips of a route, changing from bright to dark with the distance travelled,
+    as drawn by folium.ColorLine in routes_plot.
+
+    Parameters:
+    route: The route whose trips are colored.
+
+    Returns:
+    A list with the color of every trip.
+    """
+    import branca.colormap as cm
+
+    colormap = cm.linear.inferno.scale(0, route.total_distance)
+    step_colormap = reverse_colormap(colormap).to_step(12)
+    # Used for adjusting the color for the start point of the route.
+    total_distances = 5 + np.concatenate(([0], np.cumsum(route.trip_distances / 2.2)[:-1]))
+    return [step_colormap(value) for value in total_distances]
+
+def points_geojson(name:str, locs:np.ndarray, times, types, colors, extra:dict=None) -> dict:
+    """
+    Pack points into one GeoJSON FeatureCollection whose style and popup fields are feature properties.
+
+    Parameters:
+    name: The name shown as 'Rutt' in the popups.
+    locs: Array of shape (n, 2) with [lat, lon] of the points.
+    times, types, colors: Sequences of length n.
+    extra: Further properties {key: sequence of length n}.
+
+    Returns:
+    The FeatureCollection.
+    """
+    extra = extra or {}
+    features = []
+    for i in range(len(locs)):
+        properties = {'time': str(times[i]), 'loc': f'[{locs[i][0]}, {locs[i][1]}]', 'name': name, 'type': types[i],
+                      'style': {'color': colors[i], 'fillColor': colors[i]}}
+        for (key, values) in extra.items():
+            properties[key] = values[i]
+        features.append({'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [float(locs[i][1]), float(locs[i][0])]},
+                         'properties': properties})
+    return {'type': 'FeatureCollection', 'features': features}
+
+def lines_geojson(lines:list, colors:list, zoom_bands:list=None) -> dict:
+    """
+    Pack lines into a GeoJSON FeatureCollection with one MultiLineString per color.
+    With zoom_bands, every line is simplified once per band and the features carry the 'minzoom' and 'maxzoom'
+    between which they should be shown.
+
+    Parameters:
+    lines: A list of lines, each a list of [lat, lon].
+    colors: The color of every line.
+    zoom_bands: A list of (minzoom, maxzoom), see simplify.ZOOM_BANDS. The lines are kept at full resolution if None.
+
+    Returns:
+    The FeatureCollection.
+    """
+    bands = zoom_bands if zoom_bands is not None else [(0, 30)]
+    grouped = {}
+    for (line, color) in zip(lines, colors):
+        line = np.asarray(line, dtype=float).reshape(-1, 2)
+        masks = simplify.multiresolution(line[:, 0], line[:, 1], bands) if zoom_bands is not None else [np.ones(len(line), dtype=bool)]
+        for (band, mask) in zip(bands, masks):
+            grouped.setdefault((band, color), []).append(line[mask][:, ::-1].tolist())
+    features = [{'type': 'Feature', 'geometry': {'type': 'MultiLineString', 'coordinates': band_lines},
+                 'properties': {'style': {'color': color, 'weight': 4, 'opacity': 1}, 'minzoom': band[0], 'maxzoom': band[1]}}
+                for ((band, color), band_lines) in grouped.items()]
+    return {'type': 'FeatureCollection', 'features': features}
+
+def route_geojson(name:str, route, filter:list=None, G:ox=None, zoom_bands:list=simplify.ZOOM_BANDS) -> tuple:
+    """
+    Pack the points and trips of a route into GeoJSON, keeping the colors used by routes_plot.
+    Consecutive trips of the same color are joined into one line, so that they can be simplified together.
+
+    Parameters:
+    name: The name of the route.
+    route: The route to be packed.
+    filter: A list of point types to be included.
+    G: The traffic graph the exact paths of the trips refer to.
+    zoom_bands: The zoom bands the lines are simplified for, see lines_geojson.
+
+    Returns:
+    The FeatureCollections of the points and of the lines.
+    """
+    locs = np.column_stack((route.lats, route.lons))
+    types = route.types
+    selected = np.ones(len(types), dtype=bool) if filter is None else np.isin(types, filter)
+    color_table = {point_type: get_color(point_type) for point_type in set(types[selected])}
+    points = points_geojson(name, locs[selected], pd.DatetimeIndex(route.times[selected]), types[selected],
+                            [color_table[point_type] for point_type in types[selected]])
+
+    lines = []
+    colors = []
+    for (trip, color) in zip(route.trips, trips_colors(route)):
+        if trip.exact_path != None:
+            line = [[G.nodes[node]['y'], G.nodes[node]['x']] for node in trip.exact_path]
+            color = route.color
+        else:
+            line = [list(trip.start.loc), list(trip.end.loc)]
+        if colors and colors[-1] == color:
+            lines[-1].extend(line[1:] if lines[-1][-1] == line[0] else line)
+        else:
+            lines.append(line)
+            colors.append(color)
+    return points, lines_geojson(lines, colors, zoom_bands)
+
+# Shows each of the given layers of a FeatureGroup only between its minimum and maximum zoom levels.
+ZOOM_BANDS_TEMPLATE = """
+    {% macro script(this, kwargs) %}
+    (function() {
+        var bands = [
+            {%- for layer, minzoom, maxzoom in this.bands %}
+            {layer: {{ layer.get_name() }}, minzoom: {{ minzoom }}, maxzoom: {{ maxzoom }}},
+            {%- endfor %}
+        ];
+        function update() {
+            var zoom = {{ this.map.get_name() }}.getZoom();
+            bands.forEach(function(band) {
+                var visible = zoom >= band.minzoom && zoom < band.maxzoom;
+                if (visible && !{{ this.group.get_name() }}.hasLayer(band.layer)) {{ this.group.get_name() }}.addLayer(band.layer);
+                if (!visible && {{ this.group.get_name() }}.hasLayer(band.layer)) {{ this.group.get_name() }}.removeLayer(band.layer);
+            });
+        }
+        {{ this.map.get_name() }}.on('zoomend', update);
+        update();
+    })();
+    {% endmacro %}
+"""
+
+def zoom_bands(map:folium.Map, group:FeatureGroup, bands:list):
+    """
+    The map element switching the layers of a group with the zoom, see ZOOM_BANDS_TEMPLATE.
+
+    Parameters:
+    map: The map the group is added to.
+    group: The FeatureGroup holding the layers.
+    bands: A list of (layer, minzoom, maxzoom).
+
+    Returns:
+    A branca MacroElement to be added to the map.
+    """
+    from branca.element import MacroElement
+    from jinja2 import Template
+
+    element = MacroElement()
+    element._name = 'ZoomBands'
+    element._template = Template(ZOOM_BANDS_TEMPLATE)
+    element.map = map
+    element.group = group
+    element.bands = bands
+    return element
+
+@stage(counts=lambda result, routes, **_: {'routes': len(routes), 'points': sum(len(route.times) for route in routes.values())})
+def routes_plot(map:folium, routes:dict, filter:list=None, G:ox=None, geojson:bool=False):
     """
     Illustrate information points, trips and routes in the map.
     The result is illustrated in a .html map.
@@ -73,11 +347,31 @@ def routes_plot(map:folium, routes:dict, filter:list=None, G:ox=None):
     loc: The location to store the map.
     filter: A list of point types to be illustrated on the map.
     G: The traffic graph.
+    geojson: Pack the points and lines of each route into GeoJSON layers styled by their properties, with popups built by the browser,
+        instead of adding one marker and one line object per point and trip. The lines are simplified for a few zoom bands and
+        the map shows the resolution matching its zoom. The output is much smaller.
     """
-    
-    for name, route in routes.items():
+    import folium
+    import branca.colormap as cm
+    from folium import FeatureGroup
+
+    for key, route in routes.items():
+        name = group_name(routes, key)
         route_color = route.color
         feature_group = FeatureGroup(name=name, show=False)
+        if geojson:
+            points, lines = route_geojson(name, route, filter, G)
+            bands = {}
+            for feature in lines['features']:
+                bands.setdefault((feature['properties']['minzoom'], feature['properties']['maxzoom']), []).append(feature)
+            layers = [(folium.GeoJson({'type': 'FeatureCollection', 'features': features}).add_to(feature_group), minzoom, maxzoom)
+                      for ((minzoom, maxzoom), features) in bands.items()]
+            folium.GeoJson(points, marker=folium.CircleMarker(radius=5, fill=True, fill_opacity=2),
+                           popup=folium.GeoJsonPopup(fields=POPUP_FIELDS, aliases=POPUP_ALIASES)).add_to(feature_group)
+            feature_group.add_to(map)
+            zoom_bands(map, feature_group, layers).add_to(map)
+            continue
+
         time_steps = []
         ref = route.points[0].time
 
@@ -108,7 +402,125 @@ def routes_plot(map:folium, routes:dict, filter:list=None, G:ox=None):
                 
         feature_group.add_to(map)
 
-def stops_plot(map:folium, stops:dict, filter:list=None):
+SHARDED_INDEX_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map {height: 100%; margin: 0;}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var shards = __SHARDS__;
+var map = L.map('map').setView(__CENTER__, __ZOOM__);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {attribution: '&copy; OpenStreetMap contributors'}).addTo(map);
+
+function popup(layer) {
+    var p = layer.feature.properties;
+    return 'Time: ' + p.time + ' Location: ' + p.loc + ' Rutt: ' + p.name + ' Type: ' + p.type;
+}
+function geojsonLayer(data, radius) {
+    return L.geoJSON(data, {
+        style: function(feature) {return feature.properties.style;},
+        pointToLayer: function(feature, latlng) {
+            return L.circleMarker(latlng, Object.assign({radius: radius, fill: true, fillOpacity: 1}, feature.properties.style));
+        }
+    }).bindPopup(popup);
+}
+
+// Every shard is an empty layer until it is turned on in the layer control for the first time.
+var overlays = {};
+shards.forEach(function(shard) {
+    var group = L.layerGroup();
+    group.shard = shard;
+    overlays[shard.name] = group;
+});
+map.on('overlayadd', function(e) {
+    var group = e.layer;
+    if (!group.shard || group.loaded) return;
+    group.loaded = true;
+    fetch(group.shard.file).then(function(response) {return response.json();}).then(function(data) {
+        if (data.lines) {
+            group.lines = data.lines;
+            updateLines(group);
+        }
+        if (data.points) group.addLayer(geojsonLayer(data.points, 5));
+        if (data.stops) group.addLayer(geojsonLayer(data.stops, 10));
+    });
+});
+
+// Lines are simplified per zoom band. Only the features of the current band are drawn.
+function updateLines(group) {
+    var zoom = map.getZoom();
+    if (group.linesLayer) group.removeLayer(group.linesLayer);
+    group.linesLayer = L.geoJSON(group.lines, {
+        style: function(feature) {return feature.properties.style;},
+        filter: function(feature) {return zoom >= feature.properties.minzoom && zoom < feature.properties.maxzoom;}
+    });
+    group.addLayer(group.linesLayer);
+}
+map.on('zoomend', function() {
+    Object.values(overlays).forEach(function(group) {
+        if (group.lines) updateLines(group);
+    });
+});
+L.control.layers(null, overlays).addTo(map);
+</script>
+</body>
+</html>
+"""
+
+@stage(counts=lambda result, routes, stops, **_: {'routes': len(routes), 'stops': sum(map(len, stops.values()))})
+def sharded_plot(out_dir:str, routes:dict, stops:dict, filter:list=None, G:ox=None, location:list=[59.3293, 18.0686], zoom_start:int=12):
+    """
+    Illustrate routes and stops as a sharded map: one GeoJSON data file per (vehicle, date) and a small index page
+    which fetches a file only when its layer is turned on in the layer control.
+    Route and stop groups are paired by their keys without the 'GPS-'/'POD-' prefixes.
+    Browsers do not fetch files from file:// pages, so the directory has to be served, e.g. with `python -m http.server`.
+
+    Parameters:
+    out_dir: The directory where index.html and the layers/ directory are written.
+    routes: A dictionary of all the routes need to be visualised.
+    stops: A dictionary of all the stops need to be visualised.
+    filter: A list of point types to be illustrated on the map.
+    G: The traffic graph.
+    location, zoom_start: The initial view of the map.
+    """
+    shards = {}
+    for (key, route) in routes.items():
+        shards.setdefault(group_name(routes, key, prefix=False), {})['route'] = (group_name(routes, key), route)
+    for (key, stop_list) in stops.items():
+        shards.setdefault(group_name(stops, key, prefix=False), {})['stops'] = (group_name(stops, key), stop_list)
+
+    os.makedirs(os.path.join(out_dir, 'layers'), exist_ok=True)
+    index = []
+    for (shard, content) in shards.items():
+        data = {}
+        if 'route' in content:
+            data['points'], data['lines'] = route_geojson(*content['route'], filter, G)
+        if 'stops' in content:
+            data['stops'] = stops_geojson(*content['stops'], filter)
+        file = os.path.join('layers', re.sub(r'[^\w.-]', '_', shard) + '.json')
+        with open(os.path.join(out_dir, file), 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        index.append({'name': shard, 'file': file.replace(os.sep, '/')})
+
+    html = SHARDED_INDEX_TEMPLATE.replace('__SHARDS__', json.dumps(index)).replace('__CENTER__', json.dumps(location)).replace('__ZOOM__', str(zoom_start))
+    with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+        f.write(html)
+
+def stops_geojson(name:str, stop_list:list, filter:list=None) -> dict:
+    """
+    Pack stops into a GeoJSON FeatureCollection, see points_geojson.
+    """
+    stop_list = [stop for stop in stop_list if filter == None or stop.type in filter]
+    locs = np.array([stop.loc for stop in stop_list], dtype=float).reshape(-1, 2)
+    return points_geojson(name, locs, [stop.time for stop in stop_list], [stop.type for stop in stop_list], [stop.color for stop in stop_list])
+
+@stage(counts=lambda result, stops, **_: {'stops': sum(map(len, stops.values()))})
+def stops_plot(map:folium, stops:dict, filter:list=None, geojson:bool=False):
     """
     Illustrate stops in the map.
     The result is illustrated in a .html map.
@@ -117,10 +529,19 @@ def stops_plot(map:folium, stops:dict, filter:list=None):
     map: The map on which data is visualised.
     stops: A dictionary of all the stops need to be visualised.
     filter: A list of point types to be illustrated on the map.
+    geojson: Pack the stops of each group into one GeoJSON layer, see routes_plot.
     """
+    import folium
+    from folium import FeatureGroup
 
-    for (name, stop_list) in stops.items():
+    for (key, stop_list) in stops.items():
+        name = group_name(stops, key)
         feature_group = FeatureGroup(name=name, show=False)
+        if geojson:
+            folium.GeoJson(stops_geojson(name, stop_list, filter), marker=folium.CircleMarker(radius=10, fill=True, fill_opacity=2),
+                           popup=folium.GeoJsonPopup(fields=POPUP_FIELDS, aliases=POPUP_ALIASES)).add_to(feature_group)
+            feature_group.add_to(map)
+            continue
         for stop in stop_list:
             if filter == None or stop.type in filter:
                 folium.CircleMarker(
@@ -135,7 +556,12 @@ def stops_plot(map:folium, stops:dict, filter:list=None):
                 
         feature_group.add_to(map)
 
+@stage(counts=lambda result, filtered_stops, **_: {'stops': sum(map(len, filtered_stops.values()))})
 def nearest_trip_plot(filtered_stops:dict, map:map):
+    import folium
+    from folium import FeatureGroup
+    from folium.plugins import PolyLineTextPath
+
     for (stops_key, stops) in filtered_stops.items():
         flag = 0
         stops_name = stops_key[0]
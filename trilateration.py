@@ -1,149 +1,375 @@
+from __future__ import annotations
 import cluster
 import process
-import folium
-import tools
-from folium import LayerControl
+import instances
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import least_squares
-from pyproj import Proj, transform
-import math
-import numpy as np
-from scipy.optimize import minimize
-from scipy.optimize import minimize_scalar
-
-def latlon_to_utm(loc):
-    x, y = transform(proj_latlon, proj_utm, loc[1], loc[0]) # [long, lat]
+import pandas as pd
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+# pyproj and scipy are only imported when the parking locations are estimated, matplotlib only by the example below.
+if TYPE_CHECKING:
+    from pyproj import Transformer
+
+SPEED_WALKING = 1.42 # In m/s.
+
+# Statuses of the rows in the table returned by estimate_parking_locations.
+ESTIMATED = 'estimated'
+NO_OVERLAP = 'no_overlap' # The three circles never overlap, so there is no parking location consistent with the speeds.
+
+def utm_epsg(lat:float, lon:float) -> int:
+    """
+    The EPSG code of the WGS-84 UTM zone containing a location.
+    """
+    zone = min(max(int((lon + 180) // 6) + 1, 1), 60)
+    return (32600 if lat >= 0 else 32700) + zone
+
+@lru_cache(maxsize=None)
+def utm_transformer(epsg:int) -> Transformer:
+    """
+    A cached transformer from WGS-84 longitude/latitude to the given UTM zone.
+    """
+    from pyproj import Transformer
+
+    return Transformer.from_crs('EPSG:4326', f'EPSG:{epsg}', always_xy=True)
+
+def latlon_to_utm(loc, transformer:Transformer):
+    x, y = transformer.transform(loc[1], loc[0]) # [long, lat]
     return x, y
 
-def in_cirlce(point, center, radius):
-    return np.linalg.norm(np.array(point) - np.array(center)) <= radius
-
-def estimate_intersection_area(t, center1, center2, center3, max_radius, trials=500000):
-    d1 = speed_start_sec * t
-    d2 = speed_walking * (t1 - t)
-    d3 = speed_end_sec * (t2 - t1 + t)
-
-    xs = [center1[0], center2[0], center3[0]]
-    ys = [center1[1], center2[1], center3[1]]
-    min_x, max_x = min(xs) - max_radius, max(xs) + max_radius
-    min_y, max_y = min(ys) - max_radius, max(ys) + max_radius
-
-    points = np.random.uniform((min_x, min_y), (max_x, max_y), (trials, 2))
-    count = sum(in_cirlce(p, center1, d1) and in_cirlce(p, center2, d2) and in_cirlce(p, center3, d3) for p in points)
-    
-    return -count
-
-stops_csv = 'Datasets/Batch1/POD1.csv'
-routes_csv = 'Datasets/Batch1/GPS1_W904.csv'
-
-delivery_data = process.GroupedDataset(stops_csv, routes_csv)
-delivery_data.time_normalisation(delivery_data.dataset_routes, 'Tid')
-delivery_data.time_normalisation(delivery_data.dataset_stops, 'DeliveredAt')
-delivery_data.routes_organise(['Name', 'date']) 
-delivery_data.stops_organise(['Ruttnamn', 'date'])
-
-examine_vehicles_names = ['W904']
-
-filtered_stops, stops_dates = cluster.stops_filter(delivery_data, examine_vehicles_names, 2)
-corresponding_routes = cluster.routes_filter(delivery_data, stops_dates, examine_vehicles_names)
-cluster.find_nearest_trips(filtered_stops, corresponding_routes)
-
-stop = list(delivery_data.stops['POD-W904-2023-08-10'])[5]
-trip_example = stop.nearest_trip
-start = trip_example.start
-end = trip_example.end
-
-speed_start_sec = start.speed * 1000 / 3600
-speed_end_sec = end.speed * 1000 / 3600
-speed_walking = 1.42
-
-t1 = (stop.time - start.time).total_seconds()
-t2 = (end.time - stop.time).total_seconds()
-
-proj_utm = Proj(proj='utm', zone=33, ellps='WGS84', preserve_units=False)
-proj_latlon = Proj(proj='latlong', datum='WGS84')
-
-loc_start = latlon_to_utm(start.loc)
-loc_stop = latlon_to_utm(stop.loc)
-loc_end = latlon_to_utm(end.loc)
-
-t_bounds = (min(0, t1-t2), t1)
-max_radius = max(t1 * speed_start_sec, t2 * speed_end_sec, t1 * speed_walking)
-result = minimize_scalar(estimate_intersection_area, bounds=t_bounds, args=(loc_start, loc_stop, loc_end, max_radius))
-
-optimal_t = result.x
-
-for t in [optimal_t]:
-# for t in np.arange(min(0, t1-t2), t1):
-    d1 = speed_start_sec * t
-    d2 = speed_walking * (t1 - t)
-    d3 = speed_end_sec * (t2 - t1 + t)
-
-    # def objective_function(p, p1, p2, p3, d1, d2, d3):
-    #     x, y = p
-    #     return ((x - p1[0])**2 + (y - p1[1])**2 - d1**2)**2 + \
-    #         ((x - p2[0])**2 + (y - p2[1])**2 - d2**2)**2 + \
-    #         ((x - p3[0])**2 + (y - p3[1])**2 - d3**2)**2
-
-    # def constraint_circle(p, center, radius):
-    #     x, y = p
-    #     return radius - np.hypot(x - center[0], y - center[1])
-
-    # # Circle centers and radii
-    # p1 = loc_start
-    # p2 =  loc_stop
-    # p3 = loc_end
-
-    # # Constraints
-    # constraints = [
-    #     {'type': 'ineq', 'fun': constraint_circle, 'args': (p1, d1)},
-    #     {'type': 'ineq', 'fun': constraint_circle, 'args': (p2, d2)},
-    #     {'type': 'ineq', 'fun': constraint_circle, 'args': (p3, d3)}
-    # ]
-
-    # # Initial guess
-    # initial_guess = [(p1[0] + p2[0] + p3[0]) / 3, (p1[1] + p2[1] + p3[1]) / 3]
-
-    # # Run optimization
-    # result = minimize(objective_function, initial_guess, args=(p1, p2, p3, d1, d2, d3),
-    #                 method='SLSQP', constraints=constraints)
-
-    # if result.success:
-    #     optimized_location = result.x
-    #     print("Optimized Location:", optimized_location)
-
-    #     # Visualization code:
-    fig, ax = plt.subplots()
-
-    # Plotting circles
-    circle1 = plt.Circle(loc_start, d1, color='green', fill=False, linewidth=2, label='Start Travel')
-    circle2 = plt.Circle(loc_stop, d2, color='orange', fill=False, linewidth=2, label='Stop Travel')
-    circle3 = plt.Circle(loc_end, d3, color='red', fill=False, linewidth=2, label='End Travel')
-
-    ax.add_artist(circle1)
-    ax.add_artist(circle2)
-    ax.add_artist(circle3)
-
-    # Plotting the estimated location
-    # plt.plot(optimized_location[0], optimized_location[1], 'yo', markersize=5, label='Estimated Location')
-
-    # Additional plot settings
-    plt.scatter(loc_start[0], loc_start[1], c='green', label='Start')
-    plt.scatter(loc_stop[0], loc_stop[1], c='orange', label='Stop')
-    plt.scatter(loc_end[0], loc_end[1], c='red', label='End')
-    plt.xlabel('X coordinate')
-    plt.ylabel('Y coordinate')
-    plt.title('Trilateration using Least Squares')
-    plt.legend()
-    plt.axis('equal')
-
-    # Set limits for better visibility
-    plt.xlim(min(loc_start[0], loc_stop[0], loc_end[0]) - 10, max(loc_start[0], loc_stop[0], loc_end[0]) + 10)
-    plt.ylim(min(loc_start[1], loc_stop[1], loc_end[1]) - 10, max(loc_start[1], loc_stop[1], loc_end[1]) + 10)
-
-    plt.grid(True)
-
-    print(t1, t2, speed_start_sec, speed_end_sec, d1, d2, d3)
-    # plt.savefig(f'Trilateration/{t}.png')
-    plt.show()
\ No newline at end of file
+def travel_radii(t:float, speed_start:float, speed_end:float, speed_walking:float, t1:float, t2:float) -> np.ndarray:
+    """
+    The distances which can be covered around the three known locations if the vehicle was parked t seconds after the start point.
+
+    Arguments:
+    t: The driving time from the start point to the parking location, in seconds.
+    speed_start, speed_end: The speeds at the start and end points of the trip, in m/s.
+    speed_walking: The walking speed between the parking location and the stop, in m/s.
+    t1: The time from the start point to the stop, in seconds.
+    t2: The time from the stop to the end point, in seconds.
+
+    Returns:
+    The radii around the start point, the stop and the end point, in meters.
+    """
+    return np.array([speed_start * t, speed_walking * (t1 - t), speed_end * (t2 - t1 + t)])
+
+def intersection_region(centers:np.ndarray, radii:np.ndarray) -> tuple:
+    """
+    The exact area and centroid of the intersection of circles.
+    The boundary of the intersection is made of the arcs of each circle lying inside all the other circles.
+    Area and centroid are then obtained by integrating along those arcs with Green's theorem.
+
+    Arguments:
+    centers: Array of shape (n, 2) with the circle centers.
+    radii: Array of shape (n,) with the circle radii.
+
+    Returns:
+    The area, and the centroid as an array [x, y] (None if the area is 0).
+    """
+    centers = np.asarray(centers, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    if np.any(radii <= 0):
+        return 0.0, None
+    # Identical circles would contribute the same boundary twice.
+    _, unique = np.unique(np.column_stack((centers, radii)), axis=0, return_index=True)
+    centers, radii = centers[np.sort(unique)], radii[np.sort(unique)]
+
+    n = len(radii)
+    eps = 1e-9 * radii.max()
+    area = 0.0
+    moment_x = 0.0
+    moment_y = 0.0
+    for i in range(n):
+        (cx, cy), r = centers[i], radii[i]
+        angles = []
+        for j in range(n):
+            if j == i:
+                continue
+            dx, dy = centers[j] - centers[i]
+            d = np.hypot(dx, dy)
+            if d >= r + radii[j]:
+                return 0.0, None # Two disjoint circles have no intersection.
+            if d <= abs(r - radii[j]):
+                continue # One circle contains the other, the boundaries do not cross.
+            base = np.arctan2(dy, dx)
+            half = np.arccos(np.clip((r**2 + d**2 - radii[j]**2) / (2 * r * d), -1, 1))
+            angles.extend(((base - half) % (2*np.pi), (base + half) % (2*np.pi)))
+
+        angles = np.sort(angles) if angles else np.array([0.0])
+        starts = angles
+        ends = np.append(angles[1:], angles[0] + 2*np.pi)
+        middles = (starts + ends) / 2
+        points = np.column_stack((cx + r * np.cos(middles), cy + r * np.sin(middles)))
+        inside = np.all(np.linalg.norm(points[:, None, :] - centers[None, :, :], axis=2) <= radii + eps, axis=1)
+        a, b = starts[inside], ends[inside]
+        if len(a) == 0:
+            continue
+        sin_a, sin_b, cos_a, cos_b = np.sin(a), np.sin(b), np.cos(a), np.cos(b)
+        area += 0.5 * np.sum(r**2 * (b - a) + cx * r * (sin_b - sin_a) - cy * r * (cos_b - cos_a))
+        moment_x += np.sum(cx**2 * r * (sin_b - sin_a)
+                           + 2 * cx * r**2 * ((b - a) / 2 + (np.sin(2*b) - np.sin(2*a)) / 4)
+                           + r**3 * ((sin_b - sin_b**3 / 3) - (sin_a - sin_a**3 / 3))) / 2
+        moment_y += np.sum(-cy**2 * r * (cos_b - cos_a)
+                           + 2 * cy * r**2 * ((b - a) / 2 - (np.sin(2*b) - np.sin(2*a)) / 4)
+                           + r**3 * ((-cos_b + cos_b**3 / 3) - (-cos_a + cos_a**3 / 3))) / 2
+
+    if area <= 0:
+        return 0.0, None
+    return area, np.array([moment_x / area, moment_y / area])
+
+def intersection_area_monte_carlo(centers:np.ndarray, radii:np.ndarray, trials:int=100000, seed:int=0) -> float:
+    """
+    Estimate the area of the intersection of circles by sampling points in the bounding box of the smallest circle,
+    which contains the whole intersection. All the points are tested against all the circles at once.
+
+    Arguments:
+    centers: Array of shape (n, 2) with the circle centers.
+    radii: Array of shape (n,) with the circle radii.
+    trials: The number of sampled points.
+    seed: The seed of the random generator, so repeated evaluations are comparable.
+
+    Returns:
+    The estimated area.
+    """
+    centers = np.asarray(centers, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    if np.any(radii <= 0):
+        return 0.0
+    smallest = np.argmin(radii)
+    low = centers[smallest] - radii[smallest]
+    high = centers[smallest] + radii[smallest]
+    points = np.random.default_rng(seed).uniform(low, high, (trials, 2))
+    inside = np.all(np.sum((points[:, None, :] - centers[None, :, :])**2, axis=2) <= radii**2, axis=1)
+    return inside.mean() * np.prod(high - low)
+
+def estimate_intersection_area(t:float, center1, center2, center3, speed_start:float, speed_end:float, speed_walking:float,
+                               t1:float, t2:float, method:str='exact', trials:int=100000, seed:int=0) -> float:
+    """
+    The objective minimised to find the parking time: the negative area of the region reachable from all three locations.
+
+    Arguments:
+    t: The driving time from the start point to the parking location, in seconds.
+    center1, center2, center3: The projected locations of the start point, the stop and the end point, in meters.
+    speed_start, speed_end, speed_walking, t1, t2: See travel_radii.
+    method: 'exact' or 'monte_carlo'.
+    trials, seed: The parameters of intersection_area_monte_carlo.
+
+    Returns:
+    The negative intersection area in square meters.
+    """
+    centers = np.array([center1, center2, center3], dtype=float)
+    radii = travel_radii(t, speed_start, speed_end, speed_walking, t1, t2)
+    if method == 'exact':
+        area, _ = intersection_region(centers, radii)
+    elif method == 'monte_carlo':
+        area = intersection_area_monte_carlo(centers, radii, trials, seed)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'exact' or 'monte_carlo'.")
+    return -area
+
+def solve_parking_time(center1, center2, center3, speed_start:float, speed_end:float, speed_walking:float, t1:float, t2:float, grid:int=32) -> tuple:
+    """
+    Find the parking time maximising the intersection area, and the centroid of the intersection at that time.
+    The objective is flat (zero) wherever the circles do not overlap, so it is first scanned on a grid
+    and then minimised with bounds around the best grid point.
+
+    Arguments:
+    center1, center2, center3: The projected locations of the start point, the stop and the end point, in meters.
+    speed_start, speed_end, speed_walking, t1, t2: See travel_radii.
+    grid: The number of grid points scanned.
+
+    Returns:
+    The optimal time, the intersection area and its centroid (None if the circles never overlap).
+    """
+    from scipy.optimize import minimize_scalar
+
+    centers = np.array([center1, center2, center3], dtype=float)
+    args = (center1, center2, center3, speed_start, speed_end, speed_walking, t1, t2)
+    low, high = min(0, t1 - t2), t1
+    if high <= low:
+        optimal_t = low
+    else:
+        ts = np.linspace(low, high, grid)
+        values = [estimate_intersection_area(t, *args) for t in ts]
+        best = int(np.argmin(values))
+        bounds = (ts[max(best - 1, 0)], ts[min(best + 1, grid - 1)])
+        result = minimize_scalar(estimate_intersection_area, bounds=bounds, args=args, method='bounded')
+        optimal_t = result.x if result.fun <= values[best] else ts[best]
+    area, centroid = intersection_region(centers, travel_radii(optimal_t, speed_start, speed_end, speed_walking, t1, t2))
+    return optimal_t, area, centroid
+
+def solve_parking_task(task:tuple) -> tuple:
+    """
+    solve_parking_time on a tuple of its arguments, for process pools.
+    """
+    return solve_parking_time(*task)
+
+def estimate_parking_locations(filtered_stops:dict, speed_walking:float=SPEED_WALKING, workers:int=None) -> pd.DataFrame:
+    """
+    Estimate the parking location of every stop matched to a trip by cluster.find_nearest_trips.
+    All coordinates are projected at once into the UTM zone of the stops, and the optimal parking time of every stop
+    is solved serially or over a process pool.
+
+    Arguments:
+    filtered_stops: Dictionary {(name, date): [Stop1, Stop2, ...]}.
+    speed_walking: The walking speed between the parking location and the stop, in m/s.
+    workers: The number of worker processes.
+
+    Returns:
+    A table with one row per matched stop: its key, index in the stop list, the optimal driving time after the start point,
+    the intersection area, the estimated parking position and a status.
+    """
+    keys = list(filtered_stops)
+    groups, indices, times, stop_lats, stop_lons, trips = instances.StopList.flatten(filtered_stops)
+    matched = np.array([trip is not None for trip in trips], dtype=bool)
+    columns = ['name', 'date', 'stop_index', 't', 'area', 'lat', 'lon', 'status']
+    if not matched.any():
+        return pd.DataFrame(columns=columns)
+    groups, indices, times, stop_lats, stop_lons, trips = (column[matched] for column in (groups, indices, times, stop_lats, stop_lons, trips))
+
+    # The bracketing points of the trips are read from the concatenated arrays of their routes.
+    routes = list({id(trip.start.route): trip.start.route for trip in trips}.values())
+    route_ids = {id(route): i for (i, route) in enumerate(routes)}
+    offsets, _, point_times, point_lats, point_lons, point_speeds = instances.Route.concatenate(routes)
+    starts = np.array([offsets[route_ids[id(trip.start.route)]] + trip.start.index for trip in trips], dtype=np.int64)
+    ends = np.array([offsets[route_ids[id(trip.end.route)]] + trip.end.index for trip in trips], dtype=np.int64)
+
+    lats = np.column_stack((point_lats[starts], stop_lats, point_lats[ends]))
+    lons = np.column_stack((point_lons[starts], stop_lons, point_lons[ends]))
+    transformer = utm_transformer(utm_epsg(lats[:, 1].mean(), lons[:, 1].mean()))
+    xs, ys = transformer.transform(lons, lats)
+
+    speeds_start = point_speeds[starts] * 1000 / 3600
+    speeds_end = point_speeds[ends] * 1000 / 3600
+    t1 = (times - point_times[starts]).astype('timedelta64[ns]').astype(np.int64) / 1e9
+    t2 = (point_times[ends] - times).astype('timedelta64[ns]').astype(np.int64) / 1e9
+
+    tasks = [((xs[i, 0], ys[i, 0]), (xs[i, 1], ys[i, 1]), (xs[i, 2], ys[i, 2]), speeds_start[i], speeds_end[i], speed_walking, t1[i], t2[i]) for i in range(len(trips))]
+    results = process.map_groups(solve_parking_task, tasks, workers=workers)
+
+    centroids = np.array([centroid if centroid is not None else (np.nan, np.nan) for (_, _, centroid) in results], dtype=float)
+    parking_lons, parking_lats = transformer.transform(centroids[:, 0], centroids[:, 1], direction='INVERSE')
+    return pd.DataFrame({
+        'name': [keys[group][0] for group in groups.tolist()],
+        'date': [keys[group][1] for group in groups.tolist()],
+        'stop_index': indices,
+        't': [t for (t, _, _) in results],
+        'area': [area for (_, area, _) in results],
+        'lat': parking_lats,
+        'lon': parking_lons,
+        'status': [ESTIMATED if centroid is not None else NO_OVERLAP for (_, _, centroid) in results],
+    }, columns=columns)
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
+    stops_csv = 'Datasets/Batch1/POD1.csv'
+    routes_csv = 'Datasets/Batch1/GPS1_W904.csv'
+
+    delivery_data = process.GroupedDataset(stops_csv, routes_csv)
+    delivery_data.time_normalisation(delivery_data.dataset_routes, 'Tid')
+    delivery_data.time_normalisation(delivery_data.dataset_stops, 'DeliveredAt', time_shift=2)
+    delivery_data.routes_organise(['Name', 'date']) 
+    delivery_data.stops_organise(['Ruttnamn', 'date'])
+
+    examine_vehicles_names = ['W904']
+
+    filtered_stops, stops_dates = cluster.stops_filter(delivery_data, examine_vehicles_names)
+    corresponding_routes = cluster.routes_filter(delivery_data, stops_dates, examine_vehicles_names)
+    cluster.find_nearest_trips(filtered_stops, corresponding_routes)
+
+    stop = list(delivery_data.stops[('W904', '2023-08-10')])[5]
+    trip_example = stop.nearest_trip
+    start = trip_example.start
+    end = trip_example.end
+
+    speed_start_sec = start.speed * 1000 / 3600
+    speed_end_sec = end.speed * 1000 / 3600
+    speed_walking = SPEED_WALKING
+
+    t1 = (stop.time - start.time).total_seconds()
+    t2 = (end.time - stop.time).total_seconds()
+
+    parking_locations = estimate_parking_locations(filtered_stops)
+    parking_locations.to_csv('Trilateration/batch1_parking_locations.csv', index=False)
+
+    transformer = utm_transformer(utm_epsg(stop.loc[0], stop.loc[1]))
+    loc_start = latlon_to_utm(start.loc, transformer)
+    loc_stop = latlon_to_utm(stop.loc, transformer)
+    loc_end = latlon_to_utm(end.loc, transformer)
+
+    optimal_t, _, _ = solve_parking_time(loc_start, loc_stop, loc_end, speed_start_sec, speed_end_sec, speed_walking, t1, t2)
+
+    for t in [optimal_t]:
+    # for t in np.arange(min(0, t1-t2), t1):
+        d1 = speed_start_sec * t
+        d2 = speed_walking * (t1 - t)
+        d3 = speed_end_sec * (t2 - t1 + t)
+
+        # def objective_function(p, p1, p2, p3, d1, d2, d3):
+        #     x, y = p
+        #     return ((x - p1[0])**2 + (y - p1[1])**2 - d1**2)**2 + \
+        #         ((x - p2[0])**2 + (y - p2[1])**2 - d2**2)**2 + \
+        #         ((x - p3[0])**2 + (y - p3[1])**2 - d3**2)**2
+
+        # def constraint_circle(p, center, radius):
+        #     x, y = p
+        #     return radius - np.hypot(x - center[0], y - center[1])
+
+        # # Circle centers and radii
+        # p1 = loc_start
+        # p2 =  loc_stop
+        # p3 = loc_end
+
+        # # Constraints
+        # constraints = [
+        #     {'type': 'ineq', 'fun': constraint_circle, 'args': (p1, d1)},
+        #     {'type': 'ineq', 'fun': constraint_circle, 'args': (p2, d2)},
+        #     {'type': 'ineq', 'fun': constraint_circle, 'args': (p3, d3)}
+        # ]
+
+        # # Initial guess
+        # initial_guess = [(p1[0] + p2[0] + p3[0]) / 3, (p1[1] + p2[1] + p3[1]) / 3]
+
+        # # Run optimization
+        # result = minimize(objective_function, initial_guess, args=(p1, p2, p3, d1, d2, d3),
+        #                 method='SLSQP', constraints=constraints)
+
+        # if result.success:
+        #     optimized_location = result.x
+        #     print("Optimized Location:", optimized_location)
+
+        #     # Visualization code:
+        fig, ax = plt.subplots()
+
+        # Plotting circles
+        circle1 = plt.Circle(loc_start, d1, color='green', fill=False, linewidth=2, label='Start Travel')
+        circle2 = plt.Circle(loc_stop, d2, color='orange', fill=False, linewidth=2, label='Stop Travel')
+        circle3 = plt.Circle(loc_end, d3, color='red', fill=False, linewidth=2, label='End Travel')
+
+        ax.add_artist(circle1)
+        ax.add_artist(circle2)
+        ax.add_artist(circle3)
+
+        # Plotting the estimated location
+        # plt.plot(optimized_location[0], optimized_location[1], 'yo', markersize=5, label='Estimated Location')
+
+        # Additional plot settings
+        plt.scatter(loc_start[0], loc_start[1], c='green', label='Start')
+        plt.scatter(loc_stop[0], loc_stop[1], c='orange', label='Stop')
+        plt.scatter(loc_end[0], loc_end[1], c='red', label='End')
+        plt.xlabel('X coordinate')
+        plt.ylabel('Y coordinate')
+        plt.title('Trilateration using Least Squares')
+        plt.legend()
+        plt.axis('equal')
+
+        # Set limits for better visibility
+        plt.xlim(min(loc_start[0], loc_stop[0], loc_end[0]) - 10, max(loc_start[0], loc_stop[0], loc_end[0]) + 10)
+        plt.ylim(min(loc_start[1], loc_stop[1], loc_end[1]) - 10, max(loc_start[1], loc_stop[1], loc_end[1]) + 10)
+
+        plt.grid(True)
+
+        print(t1, t2, speed_start_sec, speed_end_sec, d1, d2, d3)
+        # plt.savefig(f'Trilateration/{t}.png')
+        plt.show()
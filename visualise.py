@@ -1,7 +1,9 @@
 from folium import LayerControl
 import tools
 from process import GroupedDataset
+from instrumentation import stage
 
+@stage()
 def visualisation(dataset:GroupedDataset, loc:str):
     """
     Visualise the data points and routines on the Stockholm's map.
@@ -15,15 +17,27 @@ def visualisation(dataset:GroupedDataset, loc:str):
     LayerControl().add_to(dataset.map)
     dataset.map.save(loc)
 
-stops_csv = 'Datasets/Batch3/POD3.csv'
-routes_csv = 'Datasets/Batch3/GPS3.csv'
+@stage()
+def sharded_visualisation(dataset:GroupedDataset, out_dir:str):
+    """
+    Visualise the data points and routines as a sharded map, whose layers are only loaded when they are turned on.
+
+    Arguments: 
+    dataset: The dataset processed by Group_dataset.
+    out_dir: The directory to save the index page and the data files.
+    """
+    tools.sharded_plot(out_dir, dataset.routes, dataset.stops)
+
+if __name__ == '__main__':
+    stops_csv = 'Datasets/Batch3/POD3.csv'
+    routes_csv = 'Datasets/Batch3/GPS3.csv'
 
-tools.xlsx_to_csv(excel_file_path='Datasets/Batch3/POD3.xlsx', csv_file_path=stops_csv)
-tools.xlsx_to_csv(excel_file_path='Datasets/Batch3/GPS3.xlsx', csv_file_path=routes_csv)
+    tools.xlsx_to_csv(excel_file_path='Datasets/Batch3/POD3.xlsx', csv_file_path=stops_csv)
+    tools.xlsx_to_csv(excel_file_path='Datasets/Batch3/GPS3.xlsx', csv_file_path=routes_csv)
 
-dataframe = GroupedDataset(stops_csv, routes_csv)
-dataframe.time_normalisation(dataframe.dataset_stops, 'DeliveredAt')
-dataframe.time_normalisation(dataframe.dataset_routes, 'Tid')
-dataframe.routes_organise(['Name', 'date']) 
-dataframe.stops_organise(['Ruttnamn', 'date'])
-visualisation(dataframe, 'Maps/batch3.html')
+    dataframe = GroupedDataset(stops_csv, routes_csv, cache_dir='Datasets/Batch3/Cache')
+    dataframe.time_normalisation(dataframe.dataset_stops, 'DeliveredAt')
+    dataframe.time_normalisation(dataframe.dataset_routes, 'Tid')
+    dataframe.routes_organise(['Name', 'date']) 
+    dataframe.stops_organise(['Ruttnamn', 'date'])
+    sharded_visualisation(dataframe, 'Maps/batch3')